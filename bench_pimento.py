@@ -0,0 +1,327 @@
+'''
+Benchmarks for pimento
+
+Each benchmark is reported as one line of JSON, with:
+    benchmark -  what was timed.
+    variant -  how it was run (sensitive, insensitive, fuzzy, indexed...).
+    size -  the number of items.
+    seconds -  the best wall-clock time of the runs.
+    peak_bytes -  the peak memory python allocated during one run (from tracemalloc).
+The memory benchmark reports the peak RSS of a fresh interpreter as peak_bytes instead,
+and adds rss_bytes: the RSS once the menu is built and the item list is freed.
+'''
+
+
+# [ Imports ]
+# [ - Python ]
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import timeit
+import tracemalloc
+# [ - Project ]
+import pimento
+
+
+# [ Helpers ]
+def make_items(count):
+    '''
+    Make a list of count host-like items.
+    About a quarter of them are duplicates, and about a quarter of them only
+    differ from a prior item by case.
+    '''
+    unique = max(1, count * 3 // 4)
+    items = []
+    for index in range(count):
+        item = 'host-{:07d}.example.com'.format(index % unique)
+        if index % 4 == 3:
+            item = item.upper()
+        items.append(item)
+    return items
+
+
+def make_phrases(count):
+    '''
+    Make a list of count distinct, multi-word items, for fuzzy matching.
+    '''
+    racks = ['rack-{:03d}'.format(r) for r in range(200)]
+    regions = ['us-east', 'us-west', 'eu-central', 'ap-south']
+    return [
+        'host-{:07d} {} {} web'.format(index, racks[index % len(racks)], regions[index % len(regions)])
+        for index in range(count)
+    ]
+
+
+def run_menu(items, responses, **kwargs):
+    '''
+    Run a menu over the items, answering its prompts with the given responses.
+    The menu is written to the null device.
+    '''
+    old_stdin = sys.stdin
+    with open(os.devnull, 'w') as stream:
+        sys.stdin = io.StringIO(u''.join(r + u'\n' for r in responses))
+        try:
+            return pimento.menu(items, stream=stream, **kwargs)
+        finally:
+            sys.stdin = old_stdin
+
+
+def measure(benchmark, variant, size, func, repeat):
+    '''
+    Time repeat calls to func, and measure the peak memory of one more.
+    Return the result record.
+    '''
+    seconds = min(timeit.repeat(func, number=1, repeat=repeat))
+    tracemalloc.start()
+    try:
+        func()
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        'benchmark': benchmark,
+        'variant': variant,
+        'size': size,
+        'seconds': seconds,
+        'peak_bytes': peak_bytes,
+    }
+
+
+class ScriptedReadline(object):
+    '''
+    Stands in for the readline module, so that the completion closures from
+    pimento._tab_complete_init can be called directly.
+    '''
+    def __init__(self):
+        '''Start with an empty line.'''
+        # _tab_complete_init checks the docstring for libedit
+        self.__doc__ = 'readline'
+        self.line = ''
+        self.completer = None
+        self.display_hook = None
+
+    def get_line_buffer(self):
+        '''Return the scripted line.'''
+        return self.line
+
+    def set_completer_delims(self, delims):
+        '''Ignore the delimiters.'''
+
+    def parse_and_bind(self, binding):
+        '''Ignore the binding.'''
+
+    def set_completer(self, completer):
+        '''Capture the completer.'''
+        self.completer = completer
+
+    def set_completion_display_matches_hook(self, hook):
+        '''Capture the display hook.'''
+        self.display_hook = hook
+
+    def complete(self, line, text):
+        '''Get all of the completions for the text at the end of the line, as readline would.'''
+        self.line = line
+        completions = []
+        while True:
+            try:
+                completions.append(self.completer(text, len(completions)))
+            except IndexError:
+                return completions
+
+
+# [ Benchmarks ]
+def bench_import(sizes, repeat):
+    '''
+    Time importing pimento in a fresh interpreter, as reported by -X importtime
+    (cumulative, so including everything pimento imports itself).
+    '''
+    seconds = []
+    for _ in range(repeat):
+        report = subprocess.check_output(
+            [sys.executable, '-X', 'importtime', '-c', 'import pimento'],
+            stderr=subprocess.STDOUT
+        ).decode()
+        for line in report.splitlines():
+            fields = [f.strip() for f in line.split('|')]
+            if len(fields) == 3 and fields[2] == 'pimento':
+                seconds.append(int(fields[1]) / 1e6)
+    yield {
+        'benchmark': 'import',
+        'variant': 'module',
+        'size': 0,
+        'seconds': min(seconds),
+        'peak_bytes': None,
+    }
+
+
+def bench_startup(sizes, repeat):
+    '''
+    Time a whole menu (argument checking, conversion, dedup, indexing, rendering),
+    answered with its first item.
+    '''
+    for size in sizes:
+        items = make_items(size)
+        for variant, kwargs in (('sensitive', {}), ('insensitive', {'insensitive': True})):
+            yield measure(
+                'startup', variant, size,
+                lambda: run_menu(items, [items[0]], **kwargs),
+                repeat
+            )
+
+
+def bench_dedup(sizes, repeat):
+    '''Time deduplicating the items.'''
+    for size in sizes:
+        items = make_items(size)
+        for variant, insensitive in (('sensitive', False), ('insensitive', True)):
+            yield measure(
+                'dedup', variant, size,
+                lambda: pimento._dedup(items, insensitive),
+                repeat
+            )
+
+
+def bench_check_response(sizes, repeat):
+    '''
+    Time checking one ambiguous response against the items, once the table is built.
+    '''
+    with open(os.devnull, 'w') as stream:
+        for size in sizes:
+            items = pimento._dedup(make_items(size), True)
+            phrases = make_phrases(size)
+            variants = (
+                # variant, items, insensitive, fuzzy, indexed, response, max matches shown
+                ('prefix', items, False, False, False, 'host-00000', None),
+                ('insensitive', items, True, False, False, 'HOST-00000', None),
+                ('fuzzy', phrases, True, True, False, 'WEB rack-00 east', None),
+                ('indexed', items, False, False, True, str(size // 2), None),
+                ('ranked', phrases, True, True, False, 'WEB rack-00 east', 10),
+            )
+            for variant, variant_items, insensitive, fuzzy, indexed, response, shown in variants:
+                table = pimento._ItemTable(list(variant_items), insensitive, fuzzy)
+                # build the lazy parts of the index outside of the timing
+                table.match_indices(response)
+                yield measure(
+                    'check_response', variant, size,
+                    lambda: pimento._check_response(
+                        response, table, None, indexed, stream, shown
+                    ),
+                    repeat
+                )
+
+
+def bench_render(sizes, repeat):
+    '''Time rendering the menu, whole and paged.'''
+    for size in sizes:
+        items = pimento._dedup(make_items(size), False)
+        for variant, indexed, page_size in (
+            ('plain', False, None), ('indexed', True, None), ('paged', False, 20)
+        ):
+            yield measure(
+                'render', variant, size,
+                lambda: pimento._render_menu('Options:', items, None, indexed, False, page_size),
+                repeat
+            )
+
+
+def bench_completion(sizes, repeat):
+    '''
+    Time the tab-completion closures: getting every completion for a line, then for
+    a line which extends it.
+    '''
+    readline = ScriptedReadline()
+    old_readline = pimento._readline
+    pimento._readline = readline
+    try:
+        with open(os.devnull, 'w') as stream:
+            for size in sizes:
+                variants = (
+                    ('standard', pimento._dedup(make_items(size), False), False, 'host-0000', '1'),
+                    ('fuzzy', make_phrases(size), True, 'web rack-0', '0'),
+                )
+                for variant, items, fuzzy, line, more in variants:
+                    table = pimento._ItemTable(items, False, fuzzy)
+
+                    def complete():
+                        '''Complete a new line, then the line extended.'''
+                        pimento._tab_complete_init(table, 'Options: ', stream)
+                        readline.complete(line, line.split()[-1])
+                        readline.complete(line + more, (line + more).split()[-1])
+                    yield measure('completion', variant, size, complete, repeat)
+    finally:
+        pimento._readline = old_readline
+
+
+MEMORY_SCRIPT = '''
+import gc, os, resource, sys, time
+import pimento
+size, kwargs = int(sys.argv[1]), eval(sys.argv[2])
+items = ['/usr/share/doc/pkg-{:07d}/File-{}.txt'.format(i, i % 97) for i in range(size)]
+start = time.time()
+menu = pimento.Menu(items, **kwargs)
+menu.table.match_indices('/usr/share/doc/pkg-00001')
+seconds = time.time() - start
+del items
+gc.collect()
+with open('/proc/self/statm') as statm:
+    rss_bytes = int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+print(seconds, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024, rss_bytes)
+'''
+
+
+def bench_memory(sizes, repeat):
+    '''
+    Measure the RSS of building a menu of path-like items (and matching once), in a fresh
+    interpreter, with and without compact storage.  Linux only.
+    '''
+    for size in sizes:
+        for variant, kwargs in (
+            ('sensitive', {}), ('compact', {'compact': True}),
+            ('insensitive', {'insensitive': True}),
+            ('compact-insensitive', {'insensitive': True, 'compact': True}),
+        ):
+            seconds, peak_bytes, rss_bytes = subprocess.check_output(
+                [sys.executable, '-c', MEMORY_SCRIPT, str(size), repr(kwargs)]
+            ).split()
+            yield {
+                'benchmark': 'memory',
+                'variant': variant,
+                'size': size,
+                'seconds': float(seconds),
+                'peak_bytes': int(peak_bytes),
+                'rss_bytes': int(rss_bytes),
+            }
+
+
+BENCHMARKS = {
+    'import': bench_import,
+    'startup': bench_startup,
+    'dedup': bench_dedup,
+    'check_response': bench_check_response,
+    'render': bench_render,
+    'completion': bench_completion,
+    'memory': bench_memory,
+}
+
+
+# [ Main ]
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--sizes', help='item list sizes to benchmark',
+                        type=int, nargs='+', default=[10, 1000, 100000, 1000000])
+    parser.add_argument('--repeat', help='runs per benchmark (the best is reported)',
+                        type=int, default=3)
+    parser.add_argument('--only', help='the benchmarks to run (default: all)',
+                        nargs='+', choices=sorted(BENCHMARKS), default=sorted(BENCHMARKS))
+    parser.add_argument('--output', help='file to write the results to (default: stdout)',
+                        type=argparse.FileType('w'), default=sys.stdout)
+    args = parser.parse_args()
+    for name in args.only:
+        for result in BENCHMARKS[name](args.sizes, args.repeat):
+            args.output.write(json.dumps(result, sort_keys=True) + '\n')
+            args.output.flush()
@@ -0,0 +1,15 @@
+'''
+pytest configuration for pimento's test suite
+'''
+
+
+# [ Imports ]
+# [ - Python ]
+import sys
+
+
+# [ Globals ]
+# the asyncio menu's tests are python 3.5+ syntax, so older pythons can't even collect them
+collect_ignore = []
+if sys.version_info < (3, 5):
+    collect_ignore.append('test_pimento_async.py')
@@ -6,19 +6,17 @@ Make simple python cli menus!
 # [ Imports ]
 # [ -Python ]
 # import as _name so that they do not show up as part of the module
+# pimento gets run in shell loops, so anything slow to import (argparse, readline, the
+# package metadata for the version) is imported when it's first needed, instead.
 import sys as _sys
-import argparse as _argparse
+import array as _array
+import bisect as _bisect
+import heapq as _heapq
+import itertools as _itertools
+import threading as _threading
+import time as _time
+import os as _os
 import os.path as _path
-import pkg_resources as _pkg_resources
-try:
-    # just importing readline means that 'input' will use it.
-    # this is unpythonic, but I did not write the builtins.
-    import readline as _readline
-except ImportError:
-    # No readline.
-    # Arrow support will be disabled
-    # Tab-completion will be disabled
-    _readline = None
 
 
 # [ GLOBALS ]
@@ -26,17 +24,1060 @@ except ImportError:
 # knows the user has not passed anything in, even None.  This allows the
 # default argument to be dynamic, rather than static at parse time.
 _NO_ARG=object()
-_VERSION=_pkg_resources.get_distribution("pimento").version
+# _readline is the readline module, once imported by _import_readline.
+# _NO_ARG means it hasn't been imported yet.  None means it isn't available.
+_readline=_NO_ARG
+# _GRAM_SIZE is the length of the character n-grams indexed for fuzzy matching.
+_GRAM_SIZE=3
+# _STREAM_WAIT is how long (in seconds) to wait for a streamed item list to finish loading
+# before showing the menu with the items loaded so far.
+_STREAM_WAIT=0.2
+# _NEXT_PAGE and _PREVIOUS_PAGE are the responses which move between the pages of a paged menu.
+_NEXT_PAGE='>'
+_PREVIOUS_PAGE='<'
+# _PARALLEL_THRESHOLD is the fewest fuzzy match candidates worth checking on a process pool.
+# Below it, starting the pool and shipping the work out costs more than it saves.
+_PARALLEL_THRESHOLD=50000
+# _CHUNKS_PER_PROCESS is how many chunks of candidates each process gets, so that one slow
+# chunk doesn't hold up the rest.
+_CHUNKS_PER_PROCESS=4
+# _OFFSET_TYPE is the array type code for item offsets and indices in compact item tables:
+# 64-bit, where the platform has it.
+try:
+    _array.array('q')
+    _OFFSET_TYPE='q'
+except ValueError:
+    _OFFSET_TYPE='l'
+# _SORT_CHUNK is how many keys of a compact item table are sorted at once (see
+# _sorted_by_key).
+_SORT_CHUNK=65536
+# _clock is the timer for the instrumentation events (see _PhaseTimer).
+_clock=getattr(_time, 'perf_counter', _time.time)
+# _worker_words is the word list of the item table, in a process pool worker.
+_worker_words=None
+# _CACHE_FORMAT is the version of the cached item tables (see _TableCache).  It's part of the
+# cache key, so bump it whenever the tables change shape, and old tables are just missed.
+_CACHE_FORMAT=1
+# _CACHE_MAX_BYTES is the most the cached item tables add up to, before the least recently
+# used are removed.
+_CACHE_MAX_BYTES=512 * 1024 * 1024
+# _CACHE_SUFFIX and _CACHE_TEMP_SUFFIX are the file name suffixes of the cached item tables,
+# and of the temporary files they're written to.
+_CACHE_SUFFIX='.table'
+_CACHE_TEMP_SUFFIX='.tmp'
+# _resident_tables maps the keys of compiled item tables (see _table_key) to the tables, in a
+# daemon, which keeps them in memory for the menus it serves (see _keep_tables_resident).
+# None everywhere else.
+_resident_tables=None
+# _resident_log is the (key, table) of each table a daemon's menu compiled, or None as the
+# table for each it found resident, for the daemon to keep (see _compile_table).
+_resident_log=[]
+# _CACHE_TEMP_AGE is how old (in seconds) a temporary file in the cache must be for it to be
+# left over from a menu which crashed while writing it, rather than still being written.
+_CACHE_TEMP_AGE=60 * 60
 
 
 # [ Private API ]
-def _get_standard_tc_matches(text, full_text, options):
+def _import_readline():
+    '''Import readline, if it hasn't been already, and return it (or None, if it's not available).'''
+    global _readline
+    if _readline is _NO_ARG:
+        try:
+            # just importing readline means that 'input' will use it.
+            # this is unpythonic, but I did not write the builtins.
+            import readline as _readline
+        except ImportError:
+            # No readline.
+            # Arrow support will be disabled
+            # Tab-completion will be disabled
+            _readline = None
+    return _readline
+
+
+def _get_version():
+    '''Look up the installed version of pimento.'''
+    try:
+        from importlib.metadata import version as _version
+    except ImportError:
+        # py < 3.8
+        import pkg_resources as _pkg_resources
+        return _pkg_resources.get_distribution("pimento").version
+    return _version("pimento")
+
+
+def _fold(text):
+    '''Return the case-folded form of the text, for insensitive comparisons.'''
+    try:
+        return text.casefold()
+    except AttributeError:
+        # py2 strings have no casefold
+        return text.lower()
+
+
+class _WordIndex(object):
     '''
-    get the standard tab completions.
-    These are the options which could complete the full_text.
+    An inverted index of the words in the item keys, for fuzzy matching.
+
+    words -  the distinct words, by word id.
+    postings -  by word id, the (ascending) indices of the items containing the word.
+    grams -  maps each character n-gram to the ids of the words containing it, so that the
+      words containing a fragment of a response can be found without checking every word.
+    compact -  True if the postings and grams are arrays, rather than lists (see _ItemTable).
     '''
-    final_matches = [o for o in options if o.startswith(full_text)]
-    return final_matches
+    __slots__ = ('words', 'word_ids', 'postings', 'grams', 'compact')
+
+    def __init__(self, item_words, compact=False):
+        '''Index the words of each item.'''
+        self.words = []
+        self.word_ids = {}
+        self.postings = []
+        self.grams = {}
+        self.compact = compact
+        for index, words in enumerate(item_words):
+            self.add(index, words)
+
+    def new_ids(self, ids=()):
+        '''Return a new list of ids (item indices or word ids) - an array, if compact.'''
+        if self.compact:
+            return _array.array(_OFFSET_TYPE, ids)
+        return list(ids)
+
+    def add(self, index, words):
+        '''
+        Index the words of the item at the index, which must be past any indexed so far.
+        Return the words, interned: the same strings as any equal words already indexed.
+        '''
+        interned = []
+        for word in words:
+            word_id = self.word_ids.get(word)
+            if word_id is None:
+                word_id = self.word_ids[word] = len(self.words)
+                self.words.append(word)
+                self.postings.append(self.new_ids())
+                for gram in set(word[i:i + _GRAM_SIZE] for i in range(len(word) - _GRAM_SIZE + 1)):
+                    word_ids = self.grams.get(gram)
+                    if word_ids is None:
+                        word_ids = self.grams[gram] = self.new_ids()
+                    word_ids.append(word_id)
+            interned.append(self.words[word_id])
+            postings = self.postings[word_id]
+            # a word may be repeated within an item
+            if not postings or postings[-1] != index:
+                postings.append(index)
+        return tuple(interned)
+
+    def word_ids_containing(self, fragment):
+        '''Return the ids of the words which contain the fragment.'''
+        if len(fragment) < _GRAM_SIZE:
+            # too short to have an n-gram - check the distinct words
+            return [i for i, word in enumerate(self.words) if fragment in word]
+        # every n-gram of the fragment must be in the word.  Start with the rarest.
+        grams = sorted(
+            set(fragment[i:i + _GRAM_SIZE] for i in range(len(fragment) - _GRAM_SIZE + 1)),
+            key=lambda g: len(self.grams.get(g, ()))
+        )
+        word_ids = set(self.grams.get(grams[0], ()))
+        for gram in grams[1:]:
+            if not word_ids:
+                break
+            word_ids.intersection_update(self.grams[gram])
+        # the n-grams may all be present without being in the right order
+        return [i for i in word_ids if fragment in self.words[i]]
+
+    def items_containing(self, fragment):
+        '''Return the set of indices of the items with a word which contains the fragment.'''
+        indices = set()
+        for word_id in self.word_ids_containing(fragment):
+            indices.update(self.postings[word_id])
+        return indices
+
+    def candidates(self, fragments):
+        '''
+        Return the set of indices of the items in which every fragment is contained by some
+        word.  Only these items can fuzzily match the fragments.
+        '''
+        indices = None
+        # longer fragments are more selective - start with those
+        for fragment in sorted(set(fragments), key=len, reverse=True):
+            if indices is None:
+                indices = self.items_containing(fragment)
+            else:
+                indices.intersection_update(self.items_containing(fragment))
+            if not indices:
+                break
+        return indices
+
+
+class _CompactStrings(object):
+    '''
+    A list of strings, stored compactly: one UTF-8 buffer holding all of them, and an array of
+    where each one ends.  Each string is decoded when it's read, so reading is slower than from
+    a list, but there is one small buffer instead of an object per string.
+
+    It supports as much of the list interface as the item table uses: len, iteration, indexing,
+    slicing, equality, append and extend, plus keep, to keep only some of the strings.
+    '''
+    __slots__ = ('buffer', 'ends')
+    # how undecodable input is stored: surrogates are kept as they are
+    _errors = 'surrogatepass'
+
+    def __init__(self, strings=()):
+        '''Store the strings.'''
+        self.buffer = bytearray()
+        self.ends = _array.array(_OFFSET_TYPE)
+        self.extend(strings)
+
+    def __len__(self):
+        '''The number of strings.'''
+        return len(self.ends)
+
+    def _span(self, index):
+        '''Return the (start, end) of the string at the (non-negative) index, in the buffer.'''
+        return (self.ends[index - 1] if index else 0), self.ends[index]
+
+    def __getitem__(self, index):
+        '''Return the string at the index, or a list of the strings in a slice.'''
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self.ends)))]
+        if index < 0:
+            index += len(self.ends)
+        if not 0 <= index < len(self.ends):
+            raise IndexError("string index out of range")
+        data = self.raw(index)
+        if _sys.version_info.major == 2:
+            return bytes(data)
+        return data.decode('utf-8', self._errors)
+
+    def raw(self, index):
+        '''
+        Return the string at the (non-negative) index as it's stored, without decoding it.
+        The stored strings sort, and compare, just as the strings do (see encode).
+        '''
+        start, end = self._span(index)
+        return self.buffer[start:end]
+
+    def raw_reader(self):
+        '''
+        Return a function which does what raw does, faster, for reading many strings.
+        It reads the strings as they are now: it's stale once any are added or removed.
+        '''
+        buffer = self.buffer
+        ends = self.ends
+
+        def _raw(index):
+            '''Return the string at the index, as it's stored.'''
+            return buffer[ends[index - 1] if index else 0:ends[index]]
+        return _raw
+
+    def encode(self, string):
+        '''
+        Return the string as it would be stored.  UTF-8 keeps the order of the code points,
+        even of the surrogates which stand in for undecodable bytes, so strings can be
+        compared with the stored strings this way, without decoding them.
+        '''
+        if _sys.version_info.major == 2:
+            return string
+        return string.encode('utf-8', self._errors)
+
+    def __iter__(self):
+        '''Iterate over the strings.'''
+        for index in range(len(self.ends)):
+            yield self[index]
+
+    def __eq__(self, other):
+        '''Compare the strings to another sequence of strings, as a list would.'''
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        '''Compare the strings to another sequence of strings, as a list would.'''
+        return not self == other
+
+    def append(self, string):
+        '''Add the string to the end.'''
+        self.buffer.extend(self.encode(string))
+        self.ends.append(len(self.buffer))
+
+    def extend(self, strings):
+        '''Add the strings to the end.'''
+        for string in strings:
+            self.append(string)
+
+    def update_hash(self, hasher):
+        '''Update the hasher (from hashlib) with the strings, as stored.'''
+        hasher.update(self.buffer)
+        hasher.update(self.ends)
+
+    def keep(self, indices):
+        '''Keep only the strings at the (ascending) indices, without decoding them.'''
+        buffer = bytearray()
+        ends = _array.array(_OFFSET_TYPE)
+        for index in indices:
+            start, end = self._span(index)
+            buffer.extend(self.buffer[start:end])
+            ends.append(len(buffer))
+        self.buffer = buffer
+        self.ends = ends
+
+
+class _MappedLines(_CompactStrings):
+    '''
+    The lines of a file, as compact strings, read through a memory map of the file rather
+    than into memory: only the offsets of the lines are stored, and the lines are decoded as
+    they're read.  The lines are split by the delimiter (a newline, or a NUL for the output of
+    find -print0), and rstripped, as the CLI does with piped lines.  They can't be added to.
+
+    Undecodable bytes are decoded as surrogates, as python decodes file names.
+    '''
+    __slots__ = ('starts', '_file')
+    _errors = 'surrogateescape'
+    # what rstrip strips, as bytes
+    _WHITESPACE = b' \t\n\r\x0b\x0c'
+
+    def __init__(self, path, delimiter=b'\n'):
+        '''Map the file, and find the lines in it.'''
+        import mmap as _mmap
+        self._file = open(path, 'rb')
+        self.starts = _array.array(_OFFSET_TYPE)
+        self.ends = _array.array(_OFFSET_TYPE)
+        try:
+            self.buffer = _mmap.mmap(self._file.fileno(), 0, access=_mmap.ACCESS_READ)
+        except ValueError:
+            # an empty file can't be mapped - and has no lines
+            self.buffer = b''
+        buffer = self.buffer
+        size = len(buffer)
+        whitespace = self._WHITESPACE
+        start = 0
+        while start < size:
+            end = buffer.find(delimiter, start)
+            if end < 0:
+                end = size
+            line_end = end
+            while line_end > start and buffer[line_end - 1:line_end] in whitespace:
+                line_end -= 1
+            self.starts.append(start)
+            self.ends.append(line_end)
+            start = end + 1
+
+    def _span(self, index):
+        '''Return the (start, end) of the line at the (non-negative) index, in the file.'''
+        return self.starts[index], self.ends[index]
+
+    def raw_reader(self):
+        '''Return a function which does what raw does, faster (see _CompactStrings).'''
+        buffer = self.buffer
+        starts = self.starts
+        ends = self.ends
+
+        def _raw(index):
+            '''Return the line at the index, as it's stored.'''
+            return buffer[starts[index]:ends[index]]
+        return _raw
+
+    def update_hash(self, hasher):
+        '''Update the hasher (from hashlib) with the lines, as stored in the file.'''
+        hasher.update(self.buffer)
+        hasher.update(self.starts)
+        hasher.update(self.ends)
+
+    def __reduce__(self):
+        '''
+        Pickle the lines as plain compact strings (see _TableCache), so that the file needn't
+        still be there, unchanged, when they're unpickled.
+        '''
+        buffer = bytearray()
+        ends = _array.array(_OFFSET_TYPE)
+        raw = self.raw_reader()
+        for index in range(len(self)):
+            buffer.extend(raw(index))
+            ends.append(len(buffer))
+        # (a class to call, its args, and the state of its slots)
+        return _CompactStrings, (), (None, {'buffer': buffer, 'ends': ends})
+
+    def append(self, string):
+        '''Refuse to add to the file.'''
+        raise TypeError("Lines can't be added to a mapped file.")
+
+    def keep(self, indices):
+        '''Keep only the lines at the (ascending) indices.'''
+        indices = list(indices)
+        self.starts = _array.array(_OFFSET_TYPE, (self.starts[i] for i in indices))
+        self.ends = _array.array(_OFFSET_TYPE, (self.ends[i] for i in indices))
+
+
+class _SplitKeys(object):
+    '''
+    The words of each of the keys, split when they're read, rather than stored (see
+    _ItemTable).  Indexing gives the words of a key as a tuple.
+    '''
+    __slots__ = ('keys',)
+
+    def __init__(self, keys):
+        '''Split the keys.'''
+        self.keys = keys
+
+    def __len__(self):
+        '''The number of keys.'''
+        return len(self.keys)
+
+    def __getitem__(self, index):
+        '''Return the words of the key at the index.'''
+        return tuple(self.keys[index].split())
+
+
+def _sorted_by_key(keys):
+    '''
+    Return the indices of the compact keys, sorted by key, and ties by index.
+    The keys are sorted as they're stored (see _CompactStrings.raw), a chunk at a time, and
+    the chunks merged, so that only a chunk's worth of them are ever copied out at once.
+    '''
+    raw = keys.raw_reader()
+    chunks = []
+    for start in range(0, len(keys), _SORT_CHUNK):
+        chunk = list(range(start, min(start + _SORT_CHUNK, len(keys))))
+        # the sort is stable, so ties stay in index order
+        chunk.sort(key=raw)
+        chunks.append(_array.array(_OFFSET_TYPE, chunk))
+    if len(chunks) == 1:
+        return chunks[0]
+    # (key, index) pairs merge in key order, and ties in index order
+    return (index for _, index in _heapq.merge(*[
+        ((raw(i), i) for i in chunk) for chunk in chunks
+    ]))
+
+
+class _SortedKeys(object):
+    '''
+    The compact keys in sorted order, read through the sorted indices rather than stored (see
+    _ItemTable), for bisecting into.  They're read as stored, without decoding (see
+    _CompactStrings.raw), so they must be compared with encoded keys.
+    '''
+    __slots__ = ('keys', 'sorted_indices')
+
+    def __init__(self, keys, sorted_indices):
+        '''View the keys in the sorted order.'''
+        self.keys = keys
+        self.sorted_indices = sorted_indices
+
+    def __len__(self):
+        '''The number of keys.'''
+        return len(self.sorted_indices)
+
+    def __getitem__(self, position):
+        '''Return the key at the position in the sorted order.'''
+        return self.keys.raw(self.sorted_indices[position])
+
+
+class _ItemTable(object):
+    '''
+    The menu items, normalized once for all of the matching.
+
+    Parallel lists, by item index:
+        texts -  the original item text.
+        keys -  the text the item is matched by: case-folded for insensitive menus, otherwise
+          the original text itself (not a copy).
+        words -  the words of each key, for fuzzy menus.
+    The keys are also indexed in sorted order, so that prefix lookups bisect into them, and
+    cost time proportional to the length of the prefix plus the number of matches, rather
+    than the number of items.  For fuzzy menus, the words are indexed too (see _WordIndex),
+    so that only items which could match a response are checked against it.
+
+    Items can be added or removed after the table is built (see add, extend and
+    remove_indices).  Added items are merged into the sorted keys on the next lookup.  If the
+    items are being streamed in, the table's loader supplies them (see refresh).  The version
+    counts the changes, so that anything derived from the items knows when it's stale.
+
+    If given a number of processes, fuzzy matches with enough candidates are checked on a
+    process pool (see _parallel_fuzzy_indices).  Call close to shut the pool down.
+
+    Tables can be pickled (see _TableCache): everything but the loader, the process pool and
+    the set of keys, which is rebuilt when it's needed, is kept.
+
+    A compact table stores each item once, for huge menus: the texts and keys are
+    _CompactStrings, the words are split from the keys as they're needed, the sorted keys
+    are read through the sorted indices, and the indices are arrays rather than lists of int
+    objects.  Lookups are slower, since every string is decoded as it's read.
+    Either way, a key which is the same as its text is the text itself, and a word which
+    appears in more than one item is stored once.
+    '''
+    __slots__ = (
+        'insensitive', 'fuzzy', 'texts', 'keys', 'words', 'word_index',
+        'sorted_keys', 'sorted_indices', 'num_sorted', 'loader', 'version', '_key_set',
+        'processes', '_pool', '_pool_version', 'compact'
+    )
+
+    def __init__(self, items, insensitive, fuzzy, loader=None, processes=None, compact=False):
+        '''Build the table for the (already deduplicated) items.'''
+        self.insensitive = insensitive
+        self.fuzzy = fuzzy
+        self.loader = loader
+        self.processes = processes
+        self.compact = compact
+        # the process pool for fuzzy matching, and the version of the table it has
+        self._pool = None
+        self._pool_version = None
+        given_items = items
+        if compact and not isinstance(items, _CompactStrings):
+            items = _CompactStrings(items)
+        self.texts = items
+        if not insensitive:
+            self.keys = items
+        elif compact:
+            self.keys = _CompactStrings()
+        else:
+            self.keys = []
+        # only fuzzy matching deals in words
+        self.words = None
+        self.word_index = None
+        if fuzzy:
+            self.words = _SplitKeys(self.keys) if compact else []
+            self.word_index = _WordIndex([], compact)
+        if compact:
+            self.sorted_indices = _array.array(_OFFSET_TYPE)
+            self.sorted_keys = _SortedKeys(self.keys, self.sorted_indices)
+        else:
+            self.sorted_keys = []
+            self.sorted_indices = []
+        self.num_sorted = 0
+        self.version = 0
+        # built on first use, by _known_keys
+        self._key_set = None
+        self._index(0)
+        if compact and not insensitive and isinstance(given_items, list):
+            # sort by the given items, which are the keys, rather than decoding them all again
+            self.sorted_indices = _array.array(
+                _OFFSET_TYPE, sorted(range(len(given_items)), key=given_items.__getitem__)
+            )
+            self.sorted_keys = _SortedKeys(self.keys, self.sorted_indices)
+            self.num_sorted = len(given_items)
+
+    # what isn't pickled, and what it's set to when unpickled
+    _UNPICKLED = {
+        'loader': None, 'processes': None, '_pool': None, '_pool_version': None,
+        '_key_set': None
+    }
+
+    def __getstate__(self):
+        '''Return the state to pickle (see the class documentation).'''
+        return dict(
+            (name, getattr(self, name)) for name in self.__slots__
+            if name not in self._UNPICKLED
+        )
+
+    def __setstate__(self, state):
+        '''Restore the pickled state.'''
+        for name, value in _itertools.chain(self._UNPICKLED.items(), state.items()):
+            setattr(self, name, value)
+
+    def __len__(self):
+        '''The number of items.'''
+        return len(self.texts)
+
+    def _index(self, start):
+        '''Normalize and index the items from the start index on.'''
+        self.version += 1
+        if self.insensitive:
+            texts = self.texts
+            for index in range(start, len(texts)):
+                text = texts[index]
+                key = _fold(text)
+                # don't keep a copy of text which folds to itself
+                self.keys.append(text if key == text else key)
+        if self.fuzzy:
+            for index in range(start, len(self.keys)):
+                words = self.word_index.add(index, self.keys[index].split())
+                if not self.compact:
+                    self.words.append(words)
+        if self._key_set is not None:
+            self._key_set.update(self.keys[start:])
+
+    def _known_keys(self):
+        '''Return the set of the item keys.'''
+        if self._key_set is None:
+            self._key_set = set(self.keys)
+        return self._key_set
+
+    def _sort_new(self):
+        '''Merge the keys of any items added since the last lookup into the sorted keys.'''
+        num_keys = len(self.keys)
+        if self.num_sorted == num_keys:
+            return
+        if self.compact:
+            self.sorted_indices = _array.array(_OFFSET_TYPE, _sorted_by_key(self.keys))
+            self.sorted_keys = _SortedKeys(self.keys, self.sorted_indices)
+            self.num_sorted = num_keys
+            return
+        entries = list(zip(self.sorted_keys, self.sorted_indices))
+        entries.extend(zip(self.keys[self.num_sorted:], range(self.num_sorted, num_keys)))
+        # the sort just merges the already sorted entries with the new ones
+        entries.sort()
+        self.sorted_keys = [key for key, _ in entries]
+        self.sorted_indices = [index for _, index in entries]
+        self.num_sorted = num_keys
+
+    def extend(self, items):
+        '''Add the (already deduplicated) items to the end of the table.'''
+        start = len(self.texts)
+        self.texts.extend(items)
+        self._index(start)
+
+    def add(self, items):
+        '''
+        Add the items to the end of the table, except for any which duplicate an item
+        already in it (as _dedup would drop them), and any empty items.
+        '''
+        new_items = []
+        if self.compact:
+            # a set of all of the keys would be an object per key - look them up instead
+            new_keys = set()
+            for item in items:
+                key = self.key(item)
+                if item and key not in new_keys and self._find_key(key) is None:
+                    new_keys.add(key)
+                    new_items.append(item)
+        else:
+            known_keys = self._known_keys()
+            for item in items:
+                key = self.key(item)
+                if item and key not in known_keys:
+                    known_keys.add(key)
+                    new_items.append(item)
+        self.extend(new_items)
+
+    def remove_indices(self, indices):
+        '''Remove the items at the indices.  The items after them move up to fill the gaps.'''
+        removed = set(indices)
+        if not removed:
+            return
+        self._sort_new()
+        if self._key_set is not None:
+            self._key_set.difference_update(self.keys[i] for i in removed)
+        # the new index of each item, or gone, if it's removed
+        if self.compact:
+            new_indices = _array.array(_OFFSET_TYPE)
+            gone = -1
+        else:
+            new_indices = []
+            gone = None
+        num_removed = 0
+        for index in range(len(self.texts)):
+            if index in removed:
+                new_indices.append(gone)
+                num_removed += 1
+            else:
+                new_indices.append(index - num_removed)
+        if self.compact:
+            kept = [i for i in range(len(self.texts)) if new_indices[i] != gone]
+            self.texts.keep(kept)
+            if self.insensitive:
+                self.keys.keep(kept)
+        else:
+            # update the lists in place - the keys may be the texts
+            self.texts[:] = [t for i, t in enumerate(self.texts) if new_indices[i] != gone]
+            if self.insensitive:
+                self.keys[:] = [k for i, k in enumerate(self.keys) if new_indices[i] != gone]
+        if self.fuzzy:
+            if not self.compact:
+                self.words[:] = [w for i, w in enumerate(self.words) if new_indices[i] != gone]
+            word_index = self.word_index
+            for word_id, word_postings in enumerate(word_index.postings):
+                word_index.postings[word_id] = word_index.new_ids(
+                    new_indices[i] for i in word_postings if new_indices[i] != gone
+                )
+        # removing entries keeps the sorted keys sorted
+        if self.compact:
+            self.sorted_indices = _array.array(_OFFSET_TYPE, (
+                new_indices[i] for i in self.sorted_indices if new_indices[i] != gone
+            ))
+            self.sorted_keys = _SortedKeys(self.keys, self.sorted_indices)
+            self.num_sorted = len(self.keys)
+            self.version += 1
+            return
+        entries = [
+            (key, new_indices[index])
+            for key, index in zip(self.sorted_keys, self.sorted_indices)
+            if new_indices[index] != gone
+        ]
+        self.sorted_keys = [key for key, _ in entries]
+        self.sorted_indices = [index for _, index in entries]
+        self.num_sorted = len(self.keys)
+        self.version += 1
+
+    def remove_redundant(self):
+        '''
+        Remove the empty items, and the items which duplicate an earlier item (as _dedup
+        would drop them), for a table of items which weren't deduplicated first.
+        '''
+        self._sort_new()
+        redundant = []
+        previous = None
+        key_of = self.keys.raw_reader() if self.compact else self.keys.__getitem__
+        # duplicates are sorted together, in index order
+        for index in self.sorted_indices:
+            key = key_of(index)
+            if not key or key == previous:
+                redundant.append(index)
+            previous = key
+        self.remove_indices(redundant)
+
+    def refresh(self):
+        '''Add any items the loader has loaded since the last refresh.'''
+        if self.loader is not None:
+            self.loader.load_into(self)
+
+    def loading(self):
+        '''Return True if the loader is still loading items.'''
+        return self.loader is not None and not self.loader.done
+
+    def key(self, text):
+        '''Return the key for some text (a response, say), to compare with item keys.'''
+        if self.insensitive:
+            return _fold(text)
+        return text
+
+    def prefix_range(self, prefix):
+        '''
+        Return the (start, end) positions of the keys which start with the prefix, in the
+        sorted keys: sorted_indices[start:end] are the indices of the matching items.
+        '''
+        key = self._sorted_form(self.key(prefix))
+        self._sort_new()
+        sorted_keys = self.sorted_keys
+        start = _bisect.bisect_left(sorted_keys, key)
+        # the keys which start with the key sort before it followed by the highest character
+        # (which is never in encoded keys) - bar any with that very character after it
+        highest = b'\xff' if isinstance(key, (bytes, bytearray)) else u'\U0010ffff'
+        end = _bisect.bisect_left(sorted_keys, key + highest, start)
+        num_keys = len(sorted_keys)
+        while end < num_keys and sorted_keys[end].startswith(key):
+            end += 1
+        return start, end
+
+    def prefix_indices(self, prefix):
+        '''Return the indices of the items which start with the prefix, in item order.'''
+        start, end = self.prefix_range(prefix)
+        return sorted(self.sorted_indices[start:end])
+
+    def fuzzy_indices(self, response, candidates=None):
+        '''
+        Return the indices of the items which fuzzily match the response, in item order.
+        Only the candidate indices are checked, if given.
+        '''
+        r_words = self.key(response).split()
+        if candidates is None:
+            if r_words:
+                candidates = sorted(self.word_index.candidates(r_words))
+            else:
+                candidates = range(len(self.texts))
+        if self.processes and len(candidates) >= _PARALLEL_THRESHOLD and not self.loading():
+            matches = self._parallel_fuzzy_indices(r_words, candidates)
+            if matches is not None:
+                return matches
+        return [i for i in candidates if _fuzzily_matches(r_words, self.words[i])]
+
+    def _get_pool(self):
+        '''
+        Return the process pool for fuzzy matching, or None if there can't be one.
+        The pool's workers get the words once, when they start, rather than with every
+        response - so a pool for an older version of the table is replaced.
+        '''
+        if self._pool is not None and self._pool_version != self.version:
+            self.close()
+        if self._pool is None:
+            try:
+                import concurrent.futures as _futures
+                self._pool = _futures.ProcessPoolExecutor(
+                    self.processes, initializer=_init_fuzzy_worker, initargs=(self.words,)
+                )
+            except (ImportError, TypeError):
+                # python 2, or a futures backport with no initializer
+                return None
+            self._pool_version = self.version
+        return self._pool
+
+    def _parallel_fuzzy_indices(self, r_words, candidates):
+        '''
+        Return the indices of the candidates which fuzzily match the response words, checked
+        on the process pool, or None if there is no pool.
+
+        The candidates are split into contiguous chunks, and the results are merged in chunk
+        order, so they are in item order, just as when checked serially.
+        '''
+        pool = self._get_pool()
+        if pool is None:
+            return None
+        candidates = list(candidates)
+        num_chunks = self.processes * _CHUNKS_PER_PROCESS
+        chunk_size = (len(candidates) + num_chunks - 1) // num_chunks
+        chunks = [candidates[i:i + chunk_size] for i in range(0, len(candidates), chunk_size)]
+        results = pool.map(_fuzzy_chunk_indices, [r_words] * len(chunks), chunks)
+        return [index for result in results for index in result]
+
+    def close(self):
+        '''Shut down the process pool, if there is one.'''
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+            self._pool_version = None
+
+    def match_indices(self, response):
+        '''Return the indices of the items which match the response, in item order.'''
+        if self.fuzzy:
+            return self.fuzzy_indices(response)
+        return self.prefix_indices(response)
+
+    def find(self, item):
+        '''Return the index of the item (or of its duplicate), or None, if it's not in the table.'''
+        return self._find_key(self.key(item))
+
+    def _sorted_form(self, key):
+        '''Return the key in the form of the sorted keys: encoded, for a compact table.'''
+        if self.compact:
+            return self.keys.encode(key)
+        return key
+
+    def _find_key(self, key):
+        '''Return the index of the item with the key, or None, if there isn't one.'''
+        key = self._sorted_form(key)
+        self._sort_new()
+        position = _bisect.bisect_left(self.sorted_keys, key)
+        if position < len(self.sorted_keys) and self.sorted_keys[position] == key:
+            # ties are sorted by index, so this is the first such item.
+            return self.sorted_indices[position]
+        return None
+
+    def exact_index(self, response, indices):
+        '''
+        Return the index of the first of the indexed items which the response matches
+        exactly, or None.
+        '''
+        if not self.fuzzy:
+            # a prefix match is exact if the whole key matches.
+            return self.find(response)
+        key = self.key(response)
+        keys = self.keys
+        # the item the response spells out is a better match than one with its words reordered
+        for index in indices:
+            if keys[index] == key:
+                return index
+        r_words = key.split()
+        for index in indices:
+            if _exact_fuzzy_match(r_words, self.words[index]):
+                return index
+        return None
+
+
+def _table_key(items, insensitive, fuzzy, compact):
+    '''
+    Return the key for the table of the (finite) items, with the settings: a hash of the
+    items as given (before they're converted), so that the key can be found without
+    preparing them.
+    '''
+    import hashlib as _hashlib
+    hasher = _hashlib.sha256()
+    hasher.update('{} {} {} {} {} {}\n'.format(
+        _CACHE_FORMAT, _sys.version_info.major, bool(insensitive), bool(fuzzy),
+        bool(compact), type(items).__name__
+    ).encode('ascii'))
+    if isinstance(items, _CompactStrings):
+        items.update_hash(hasher)
+        return hasher.hexdigest()
+    try:
+        joined = '\0'.join(items)
+    except (TypeError, UnicodeError):
+        # not all strings - the table is built from their strings, so hash those
+        items = [str(i) for i in items]
+        joined = '\0'.join(items)
+    if not isinstance(joined, bytes):
+        joined = joined.encode('utf-8', _CompactStrings._errors)
+    hasher.update(joined)
+    # the lengths tell items with NULs in them from separate items
+    hasher.update(_array.array(_OFFSET_TYPE, map(len, items)))
+    return hasher.hexdigest()
+
+
+class _TableCache(object):
+    '''
+    A directory of item tables, pickled, so that a menu of the same items as a recent one
+    can load its table instead of converting, deduplicating and indexing the items again.
+
+    Each table is in a file named for its key: a hash of the items and of the settings the
+    table depends on (see _table_key).  Tables are written to a temporary file and renamed into
+    place, so that menus running at the same time never read half a table, and the last
+    writer wins.  Loading a table marks it as used, and once the tables add up to more than
+    max_bytes, the least recently used are removed.
+
+    The cache is only ever an optimization: a table which can't be read is rebuilt, and one
+    which can't be written isn't cached.  Tables are pickles - only use a directory which
+    no one else can write to.
+    '''
+    __slots__ = ('directory', 'max_bytes')
+
+    def __init__(self, directory, max_bytes=_CACHE_MAX_BYTES):
+        '''Use the directory, which is created when the first table is stored.'''
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def _table_path(self, key):
+        '''Return the path of the table with the key.'''
+        return _path.join(self.directory, key + _CACHE_SUFFIX)
+
+    def load(self, key):
+        '''Return the table with the key, or None, if it isn't cached (or can't be read).'''
+        import pickle as _pickle
+        path = self._table_path(key)
+        try:
+            with open(path, 'rb') as table_file:
+                table = _pickle.load(table_file)
+        except (IOError, OSError):
+            return None
+        except Exception:
+            # unreadable - from a crash, or an older pimento.  Rebuild it.
+            self._remove(path)
+            return None
+        try:
+            # mark it as recently used
+            _os.utime(path, None)
+        except OSError:
+            pass
+        return table
+
+    def store(self, key, table):
+        '''Store the table with the key, then remove the least recently used tables.'''
+        import pickle as _pickle
+        import tempfile as _tempfile
+        try:
+            if not _path.isdir(self.directory):
+                _os.makedirs(self.directory)
+        except OSError:
+            # another menu made it first, or it can't be made - then storing will fail, below
+            pass
+        try:
+            handle, temp_path = _tempfile.mkstemp(suffix=_CACHE_TEMP_SUFFIX, dir=self.directory)
+        except OSError:
+            return
+        try:
+            with _os.fdopen(handle, 'wb') as table_file:
+                _pickle.dump(table, table_file, _pickle.HIGHEST_PROTOCOL)
+            # replace, rather than rename, overwrites on windows too
+            getattr(_os, 'replace', _os.rename)(temp_path, self._table_path(key))
+        except Exception:
+            self._remove(temp_path)
+            return
+        self.evict()
+
+    def evict(self):
+        '''
+        Remove the least recently used tables, until they add up to at most max_bytes, and
+        any temporary files left over from crashes.
+        '''
+        tables = []
+        try:
+            names = _os.listdir(self.directory)
+        except OSError:
+            return
+        now = _time.time()
+        for name in names:
+            path = _path.join(self.directory, name)
+            try:
+                stat = _os.stat(path)
+            except OSError:
+                # removed by another menu
+                continue
+            if name.endswith(_CACHE_SUFFIX):
+                tables.append((stat.st_mtime, stat.st_size, path))
+            elif name.endswith(_CACHE_TEMP_SUFFIX) and now - stat.st_mtime > _CACHE_TEMP_AGE:
+                self._remove(path)
+        total = 0
+        for _, size, path in sorted(tables, reverse=True):
+            total += size
+            if total > self.max_bytes:
+                self._remove(path)
+
+    def _remove(self, path):
+        '''Remove the file, if it's still there.'''
+        try:
+            _os.remove(path)
+        except OSError:
+            pass
+
+
+class _ItemLoader(object):
+    '''
+    Loads items from a stream (an iterable with no length) on a background thread, so that
+    the menu can be shown, and matched against, before the stream is exhausted.
+
+    The thread only converts the items to rstripped strings.  The menu's thread takes the
+    loaded items from it (see load_into), and deduplicates and indexes them, so that the item
+    table is only ever used by one thread.
+
+    head -  the first items loaded, up to and including the default index, for checking and
+      setting the default.
+    head_size -  the number of items the head will hold, once loaded.
+    count -  the number of items loaded.
+    done -  True once the stream is exhausted (or raised an error).
+    '''
+    def __init__(self, items, default_index):
+        '''Start loading the items.'''
+        self.head = []
+        self.count = 0
+        self.done = False
+        self._loaded = []
+        self._error = None
+        self._condition = _threading.Condition()
+        self.head_size = 0
+        if isinstance(default_index, int) and default_index >= 0:
+            self.head_size = default_index + 1
+        thread = _threading.Thread(target=self._load, args=(items,))
+        # don't keep the process alive just to finish reading the stream
+        thread.daemon = True
+        thread.start()
+
+    def _load(self, items):
+        '''Load the items (runs on the background thread).'''
+        try:
+            for item in items:
+                item = str(item).rstrip()
+                with self._condition:
+                    if self.count < self.head_size:
+                        self.head.append(item)
+                    self.count += 1
+                    self._loaded.append(item)
+                    self._condition.notify_all()
+        except Exception as e:
+            self._error = e
+        finally:
+            with self._condition:
+                self.done = True
+                self._condition.notify_all()
+
+    def wait(self, condition, timeout=None):
+        '''
+        Wait until the condition (a function of no args) is True, or loading is done, or the
+        timeout (in seconds) expires, if given.
+        '''
+        deadline = None if timeout is None else _time.time() + timeout
+        with self._condition:
+            while not (self.done or condition()):
+                remaining = None if deadline is None else deadline - _time.time()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+
+    def has_new(self):
+        '''Return True if there are items loaded since the last load_into.'''
+        return bool(self._loaded)
+
+    def load_into(self, table):
+        '''Add the items loaded since the last call to the table.'''
+        with self._condition:
+            loaded, self._loaded = self._loaded, []
+            error = self._error
+        if error is not None:
+            raise error
+        if loaded:
+            # the table deduplicates them and removes empty options
+            table.add(loaded)
 
 
 def _get_fuzzy_tc_matches(text, full_text, options):
@@ -45,22 +1086,28 @@ def _get_fuzzy_tc_matches(text, full_text, options):
     return only the individual words which have not yet been matched
     which also match the text being tab-completed.
     '''
-    print("text: {}, full: {}, options: {}".format(text, full_text, options))
+    return _get_fuzzy_tc_word_matches(text, full_text, [o.split() for o in options])
+
+
+def _get_fuzzy_tc_word_matches(text, full_text, option_words):
+    '''
+    Get the fuzzy tab completions, as for _get_fuzzy_tc_matches, from the options'
+    already-split words.
+    '''
+    # get the input tokens
+    input_tokens = full_text.split()
     # get the options which match the full text
-    matching_options = _get_fuzzy_matches(full_text, options)
+    matching_options = [w for w in option_words if _fuzzily_matches(input_tokens, w)]
     # need to only return the individual words which:
     # - match the 'text'
     # - are not exclusively matched by other input in full_text
     # - when matched, still allows all other input in full_text to be matched
-    # get the input tokens
-    input_tokens = full_text.split()
     # remove one instance of the text to be matched
-    initial_tokens = input_tokens.remove(text)
+    input_tokens.remove(text)
     # track the final matches:
     final_matches = []
-    # find matches per option
-    for option in options:
-        option_tokens = option.split()
+    # find matches per matching option
+    for option_tokens in matching_options:
         # get tokens which match the text
         matches = [t for t in option_tokens if text in t]
         # get input tokens which match one of the matches
@@ -76,18 +1123,52 @@ def _get_fuzzy_tc_matches(text, full_text, options):
         # the match, it's ok to return it.
         for match in matches:
             # copy option tokens
-            option_tokens_minus_match = option_tokens[:]
+            option_tokens_minus_match = list(option_tokens)
             # remove the match
             option_tokens_minus_match.remove(match)
-            option_minus_match = ' '.join(option_tokens_minus_match)
-            if _get_fuzzy_matches(' '.join(input_tokens), [option_minus_match]):
+            if _fuzzily_matches(input_tokens, option_tokens_minus_match):
                 if match not in final_matches:
                     final_matches.append(match)
     return final_matches
 
 
-def _tab_complete_init(items, post_prompt, insensitive, fuzzy, stream):
-    '''Create and use a tab-completer object'''
+def _tab_complete_init(table, post_prompt, output):
+    '''
+    Create and use a tab-completer object, which shows matches on the output buffer.
+    Return it, so that it can be used again (see _tab_complete_use).
+    '''
+    # readline asks for the matches one 'state' at a time, for the same text, until
+    # it runs out.  Compute the matches once per (line, text), and remember which
+    # items matched the line, so that typing more narrows those instead of starting
+    # over from all of the items.
+    cache = {
+        'key': None,
+        'matches': [],
+        'full_text': None,
+        'candidates': None,
+        'version': None,
+    }
+
+    def _get_candidates(full_text):
+        '''
+        Get the indices of the items which match the full text, narrowing the
+        candidates for the previous full text if this one extends it.
+        '''
+        previous = cache['full_text']
+        # (items still loading may have been added since)
+        if (previous is not None and full_text.startswith(previous)
+                and cache['version'] == table.version):
+            # anything matching the extended text also matched the previous text
+            candidates = table.fuzzy_indices(full_text, cache['candidates']) if table.fuzzy else [
+                i for i in cache['candidates'] if table.keys[i].startswith(full_text)
+            ]
+        else:
+            candidates = table.match_indices(full_text)
+        cache['full_text'] = full_text
+        cache['candidates'] = candidates
+        cache['version'] = table.version
+        return candidates
+
     # using some sort of nested-scope construct is
     # required because readline doesn't pass the necessary args to
     # its callback functions
@@ -101,38 +1182,38 @@ def _tab_complete_init(items, post_prompt, insensitive, fuzzy, stream):
         to return matches_for(text)[state], where 'matches_for' returns
         the matches for the text from the options.
         '''
-        # a copy of all the valid options
-        options = [o for o in items]
-        # the full user-entered text
-        full_text = _readline.get_line_buffer()
-        # insensitivity
-        if insensitive:
-            options = [o.lower() for o in options]
-            text = text.lower()
-            full_text = full_text.lower()
-        # matches
-        matches = []
-        try:
-            # get matches
-            if fuzzy:
-                # space-delimited - match words
-                _readline.set_completer_delims(' ')
-                matches = _get_fuzzy_tc_matches(text, full_text, options)
-            else:
-                # not delimited - match the whole text
-                _readline.set_completer_delims('')
-                matches = _get_standard_tc_matches(text, full_text, options)
-            # re-sensitization not necessary - this completes what's on
-            # the command prompt.  If the search is insensitive, then
-            # a lower-case entry will match as well as an original-case
-            # entry.
-        except Exception:
-            # try/catch is for debugging only.  The readline
-            # lib swallows exceptions and just doesn't print anything
-            import traceback as _traceback
-            print(_traceback.format_exc())
-            raise
-        return matches[state]
+        # the full user-entered text, insensitivized if necessary
+        full_text = table.key(_readline.get_line_buffer())
+        text = table.key(text)
+        table.refresh()
+        # only recompute the matches for new input (or new items)
+        if cache['key'] != (full_text, text, table.version):
+            try:
+                candidates = _get_candidates(full_text)
+                # get matches
+                if table.fuzzy:
+                    # space-delimited - match words
+                    _readline.set_completer_delims(' ')
+                    matches = _get_fuzzy_tc_word_matches(
+                        text, full_text, [table.words[i] for i in candidates]
+                    )
+                else:
+                    # not delimited - match the whole text
+                    _readline.set_completer_delims('')
+                    matches = [table.keys[i] for i in candidates]
+                # re-sensitization not necessary - this completes what's on
+                # the command prompt.  If the search is insensitive, then
+                # a lower-case entry will match as well as an original-case
+                # entry.
+            except Exception:
+                # try/catch is for debugging only.  The readline
+                # lib swallows exceptions and just doesn't print anything
+                import traceback as _traceback
+                print(_traceback.format_exc())
+                raise
+            cache['key'] = (full_text, text, table.version)
+            cache['matches'] = matches
+        return cache['matches'][state]
 
     def _completion_display(substitution, matches, length):
         '''
@@ -141,26 +1222,34 @@ def _tab_complete_init(items, post_prompt, insensitive, fuzzy, stream):
         '''
         try:
             response = substitution
-            stream.write("\n[!] \"{response}\" matches multiple options:\n".format(
+            output.write("\n[!] \"{response}\" matches multiple options:\n".format(
                 response=response
             ))
-            if fuzzy:
-                if insensitive:
-                    ordered_matches = [o for o in items if substitution in o.lower()]
-                else:
-                    ordered_matches = [o for o in items if substitution in o]
+            if table.fuzzy and substitution and not any(c.isspace() for c in substitution):
+                # a match within a key is a match within one of its words
+                ordered_matches = [
+                    table.texts[i]
+                    for i in sorted(table.word_index.items_containing(substitution))
+                ]
+            elif table.fuzzy:
+                # a match across words is a match within each of its words, too - so only
+                # the items with its longest word in them need checking
+                fragments = substitution.split()
+                candidates = range(len(table))
+                if fragments:
+                    candidates = sorted(
+                        table.word_index.items_containing(max(fragments, key=len))
+                    )
+                keys = table.keys
+                ordered_matches = [table.texts[i] for i in candidates if substitution in keys[i]]
             else:
-                if insensitive:
-                    ordered_matches = [o for o in items if o.lower().startswith(substitution)]
-                else:
-                    ordered_matches = [o for o in items if o.startswith(substitution)]
-            for match in ordered_matches:
-                stream.write("[!]   {}\n".format(match))
-            stream.write("[!] Please specify your choice further.\n")
+                ordered_matches = [table.texts[i] for i in table.prefix_indices(substitution)]
+            output.write(''.join("[!]   {}\n".format(match) for match in ordered_matches))
+            output.write("[!] Please specify your choice further.\n")
             # the full user-entered text
             full_text = _readline.get_line_buffer()
-            stream.write(post_prompt + full_text)
-            stream.flush()
+            output.write(post_prompt + full_text)
+            output.flush()
         except Exception:
             # try/catch is for debugging only.  The readline
             # lib swallows exceptions and just doesn't print anything
@@ -168,6 +1257,14 @@ def _tab_complete_init(items, post_prompt, insensitive, fuzzy, stream):
             #print(_traceback.format_exc())
             raise
 
+    completer = (_get_matches, _completion_display)
+    _tab_complete_use(completer)
+    return completer
+
+
+def _tab_complete_use(completer):
+    '''Use the tab-completer object (from _tab_complete_init)'''
+    get_matches, completion_display = completer
     # activate tab completion
     # got libedit bit from:
     # https://stackoverflow.com/a/7116997
@@ -180,31 +1277,35 @@ def _tab_complete_init(items, post_prompt, insensitive, fuzzy, stream):
         _readline.parse_and_bind("tab: complete")
     # -----------------------------------
     # set the function that will actually provide the valid completions
-    _readline.set_completer(_get_matches)
+    _readline.set_completer(get_matches)
     # set the function that will display the valid completions
-    _readline.set_completion_display_matches_hook(_completion_display)
+    _readline.set_completion_display_matches_hook(completion_display)
     #_readline.set_completer_delims('')
 
 
-def _prompt(pre_prompt, items, post_prompt, default, indexed, stream):
+def _render_menu(pre_prompt, items, default, indexed, loading=False, page_size=None, page=0):
     '''
-    Prompt once.
-    If you want the default displayed, put a format {} into the
-    post_prompt string (like 'select one [{}]: ')
+    Render the menu: the pre-prompt and the items, one per line.
+    If the items are still loading, say so after them.
+    If there is a page size, only show that page of the items, and say which
+    items are shown after them.
     '''
     # try to sub in the default if provided
-    if default is not None:
-        if '{}' in pre_prompt:
-            pre_prompt = pre_prompt.format(default)
-        if '{}' in post_prompt:
-            post_prompt = post_prompt.format(default)
+    if default is not None and '{}' in pre_prompt:
+        pre_prompt = pre_prompt.format(default)
     # build the item strings
     item_format = "{indent}{item}"
     if indexed:
         item_format = "{indent}[{index}] {item}"
     item_text_list = []
     indent = '  '
-    for index, item in enumerate(items):
+    num_items = len(items)
+    start = 0
+    end = num_items
+    if page_size is not None:
+        start = min(page * page_size, num_items)
+        end = min(start + page_size, num_items)
+    for index, item in enumerate(items[start:end], start):
         item_text = ''
         components = {
             'indent': indent,
@@ -216,9 +1317,135 @@ def _prompt(pre_prompt, items, post_prompt, default, indexed, stream):
         item_text_list.append(item_text)
     # build full menu
     menu_parts = [pre_prompt] + item_text_list
+    if page_size is not None and num_items > page_size:
+        menu_parts.append(
+            "[!] showing options {first}-{last} of {total}.  Enter '{next}' or '{previous}' for the next or previous page.".format(
+                first=start + 1, last=end, total=num_items, next=_NEXT_PAGE, previous=_PREVIOUS_PAGE
+            )
+        )
+    if loading:
+        menu_parts.append(
+            "[!] still loading - {} options so far.  Enter nothing to refresh.".format(num_items)
+        )
     full_menu = '\n'.join(menu_parts) + '\n'
-    stream.write(full_menu)
-    stream.flush()
+    return full_menu
+
+
+def _encode_menu(menu_text, stream):
+    '''
+    Encode the rendered menu for the stream's underlying binary buffer, if it has one.
+    Return None if it doesn't.
+    '''
+    if not hasattr(stream, 'buffer'):
+        return None
+    return menu_text.encode(stream.encoding or 'utf-8', stream.errors or 'strict')
+
+
+class _PhaseTimer(object):
+    '''
+    Times a phase of the menu, as a with block, and reports it to the on_event callback as
+    {'event': phase, 'seconds': seconds}, plus any fields set during the block.
+    With no callback, it reports nothing.
+    '''
+    __slots__ = ('on_event', 'phase', 'fields', 'start')
+
+    def __init__(self, on_event, phase):
+        '''Get ready to time the phase.'''
+        self.on_event = on_event
+        self.phase = phase
+        self.fields = {}
+        self.start = None
+
+    def __enter__(self):
+        '''Start timing.'''
+        self.start = _clock()
+        return self
+
+    def __exit__(self, *exc_info):
+        '''Stop timing, and report the phase.'''
+        if self.on_event is not None:
+            event = {'event': self.phase, 'seconds': _clock() - self.start}
+            event.update(self.fields)
+            self.on_event(event)
+
+
+class _OutputBuffer(object):
+    '''
+    Collects the output for a stream, and writes it all at once when flushed, so that a
+    prompt cycle's messages and menu go out in one write, rather than one per line.
+
+    stream -  the stream written to.
+    writes -  the number of writes made to the stream.
+    bytes_written -  the number of bytes written to the stream (characters, for a stream with
+      no binary buffer).
+    hook -  if set, called with the number of bytes of each write, for instrumentation.
+    '''
+    __slots__ = ('stream', 'parts', 'writes', 'bytes_written', 'hook')
+
+    def __init__(self, stream, hook=None):
+        '''Start with nothing to write.'''
+        self.stream = stream
+        # (text, encoded text or None) pairs
+        self.parts = []
+        self.writes = 0
+        self.bytes_written = 0
+        self.hook = hook
+
+    def write(self, text):
+        '''Add the text to the output.'''
+        self.parts.append((text, None))
+
+    def write_menu(self, rendered_menu):
+        '''Add a rendered menu (a (text, encoded text) pair) to the output.'''
+        self.parts.append(rendered_menu)
+
+    def flush(self):
+        '''Write out everything added since the last flush, in one write.'''
+        if not self.parts:
+            return
+        parts, self.parts = self.parts, []
+        stream = self.stream
+        if hasattr(stream, 'buffer'):
+            encoding = stream.encoding or 'utf-8'
+            errors = stream.errors or 'strict'
+            data = b''.join(
+                text.encode(encoding, errors) if encoded is None else encoded
+                for text, encoded in parts
+            )
+            # anything already written as text has to go out first
+            stream.flush()
+            stream.buffer.write(data)
+            stream.buffer.flush()
+        else:
+            data = ''.join(text for text, _ in parts)
+            stream.write(data)
+        stream.flush()
+        self.writes += 1
+        self.bytes_written += len(data)
+        if self.hook is not None:
+            self.hook(len(data))
+
+
+def _format_post_prompt(post_prompt, default):
+    '''Sub the default into the post prompt, if there is one, and it has a format {}.'''
+    if default is not None and '{}' in post_prompt:
+        return post_prompt.format(default)
+    return post_prompt
+
+
+def _prompt(rendered_menu, post_prompt, default, output):
+    '''
+    Prompt once.
+    If you want the default displayed, put a format {} into the
+    post_prompt string (like 'select one [{}]: ')
+    The rendered menu is a (text, encoded text) pair from _render_menu and
+    _encode_menu, or None, to prompt without showing the menu.  It is written
+    to the output buffer, with anything else already in it, in one write.
+    '''
+    post_prompt = _format_post_prompt(post_prompt, default)
+    if rendered_menu is not None:
+        output.write_menu(rendered_menu)
+    output.flush()
     # Get user response
     # - py 2/3 compatibility
     get_input = input
@@ -231,144 +1458,213 @@ def _prompt(pre_prompt, items, post_prompt, default, indexed, stream):
     return response
 
 
-def _fuzzily_matches(response, candidate):
-    '''return True if response fuzzily matches candidate'''
-    r_words = response.split()
-    c_words = candidate.split()
-    # match whole words first
-    for word in r_words:
-        if word in c_words:
-            r_words.remove(word)
-            c_words.remove(word)
-    # match partial words, fewest matches first
-    match_pairs = []
-    for partial in sorted(r_words, key=lambda p: len(p), reverse=True):
-        matches = [w for w in c_words if partial in w]
-        match_pairs.append((partial, matches))
-    # if all items can be uniquly matched, the match is passed
-    while len(match_pairs):
-        min_pair = min(match_pairs, key=lambda x:len(x[1]))
-        # this is the partial and matches with the shortest match list
-        # if there are ever no matches for something, the match is failed
-        if len(min_pair[1]) == 0:
+def _matches_every_fragment(adjacency, num_words):
+    '''
+    Return True if every fragment can be assigned a word of its own, given the adjacency: for
+    each fragment, the indices of the words which contain it.
+
+    This is a bipartite matching, found with Hopcroft-Karp: each phase finds the shortest
+    augmenting paths from the unmatched fragments (breadth first), then augments along a
+    maximal set of them (depth first), until no path is left.
+    '''
+    num_fragments = len(adjacency)
+    fragment_match = [None] * num_fragments
+    word_match = [None] * num_words
+    # seed with a greedy matching - usually it is already complete
+    matched = 0
+    for fragment, words in enumerate(adjacency):
+        for word in words:
+            if word_match[word] is None:
+                word_match[word] = fragment
+                fragment_match[fragment] = word
+                matched += 1
+                break
+    layers = [None] * num_fragments
+
+    def _augment(fragment):
+        '''Augment along a shortest path from the fragment, if there is one.'''
+        for word in adjacency[fragment]:
+            other = word_match[word]
+            if other is None or (layers[other] == layers[fragment] + 1 and _augment(other)):
+                word_match[word] = fragment
+                fragment_match[fragment] = word
+                return True
+        # dead end - don't search through this fragment again this phase
+        layers[fragment] = None
+        return False
+
+    while matched < num_fragments:
+        # layer the fragments by distance from the unmatched ones
+        queue = []
+        for fragment in range(num_fragments):
+            if fragment_match[fragment] is None:
+                layers[fragment] = 0
+                queue.append(fragment)
+            else:
+                layers[fragment] = None
+        found_path = False
+        for fragment in queue:
+            for word in adjacency[fragment]:
+                other = word_match[word]
+                if other is None:
+                    found_path = True
+                elif layers[other] is None:
+                    layers[other] = layers[fragment] + 1
+                    queue.append(other)
+        if not found_path:
             return False
-        # choose the match with the fewest matches to remaining partials.
-        # that way we leave more options for more partials, for the best
-        # chance of a full match
-        partials_left = [p[0] for p in match_pairs]
-        min_option = min(min_pair[1], key=lambda x:len([p for p in partials_left if x in p]))
-        # remove the current pair - we've matched it now
-        match_pairs.remove(min_pair)
-        # remove the matched option from all pairs' options so it won't be matched again
-        for pair in match_pairs:
-            pair_options = pair[1]
-            if min_option in pair_options:
-                pair_options.remove(min_option)
-    # if all the items in the response were matched, this is match
+        for fragment in range(num_fragments):
+            if fragment_match[fragment] is None and _augment(fragment):
+                matched += 1
     return True
 
 
-def _get_fuzzy_matches(response, items):
-    '''returns the list of items which fuzzily match the response'''
-    return [i for i in items if _fuzzily_matches(response, i)]
+def _fuzzily_matches(r_words, c_words):
+    '''
+    return True if the response words fuzzily match the candidate words:
+    each response word is contained by a different candidate word.
+    '''
+    # can't give each response word its own candidate word
+    if len(r_words) > len(c_words):
+        return False
+    adjacency = []
+    for partial in r_words:
+        words = [index for index, word in enumerate(c_words) if partial in word]
+        # if there are ever no matches for something, the match is failed
+        if not words:
+            return False
+        adjacency.append(words)
+    return _matches_every_fragment(adjacency, len(c_words))
 
 
-def _exact_fuzzy_match(response, match, insensitive):
+def _init_fuzzy_worker(words):
+    '''Keep the item table's words for fuzzy matching (runs in each process pool worker).'''
+    global _worker_words
+    _worker_words = words
+
+
+def _fuzzy_chunk_indices(r_words, indices):
     '''
-    Return True if the response matches fuzzily exactly.
-    Insensitivity is taken into account.
+    Return the indices of the items which fuzzily match the response words, of those given
+    (runs in a process pool worker).
     '''
-    if insensitive:
-        response = response.lower()
-        match = match.lower()
-    r_words = response.split()
-    m_words = match.split()
-    # match whole words first
-    for word in r_words:
-        if word in m_words:
-            r_words.remove(word)
-            m_words.remove(word)
-    # no partial matches allowed
-    # if all the items in the response were matched,
-    # and all the items in the match were matched,
-    # then this is an exact fuzzy match
-    return len(r_words) == 0 and len(m_words) == 0
-
-
-def _exact_match(response, matches, insensitive, fuzzy):
-    '''
-    returns an exact match, if it exists, given parameters
-    for the match
-    '''
-    for match in matches:
-        if response == match:
-            return match
-        elif insensitive and response.lower() == match.lower():
-            return match
-        elif fuzzy and _exact_fuzzy_match(response, match, insensitive):
-            return match
-    else:
-        return None
+    return [i for i in indices if _fuzzily_matches(r_words, _worker_words[i])]
 
 
-def _check_response(response, items, default, indexed, stream, insensitive, fuzzy):
-    '''Check the response against the items'''
-    # Set selection
-    selection = None
+def _exact_fuzzy_match(r_words, m_words):
+    '''
+    Return True if the response words match the match words fuzzily exactly:
+    every word matches a whole word, with none left over on either side.
+    '''
+    return sorted(r_words) == sorted(m_words)
+
+
+def _match_response(response, table, default, indexed):
+    '''
+    Match the response against the item table, without any output.
+    Return (selected_index, match_indices):
+        selected_index -  the index of the selected item, or None if there isn't one.
+        match_indices -  the indices of the matching items, if there is no selection:
+          empty for an invalid response, several for an ambiguous one.
+    Only indices are dealt in - the callers look up the texts of the items they show.
+    '''
     # if indexed, check for index
-    if indexed:
-        if response.isdigit():
-            index_response = int(response)
-            if index_response < len(items):
-                selection = items[index_response]
-    # if not matched by an index, match by text
-    if selection is None:
-        # insensivitize, if necessary
-        original_items = items[:]
-        original_response = response
-        if insensitive:
-            response = response.lower()
-            items = [i.lower() for i in items]
-        # Check for text matches
-        if fuzzy:
-            matches = _get_fuzzy_matches(response, items)
-        # if insensitive, lowercase the comparison
-        else:
-            matches = [i for i in items if i.startswith(response)]
-        # re-sensivitize if necessary
-        if insensitive:
-            matches = [
-                i for i in original_items
-                if i.lower() in matches
-            ]
-            response = original_response
-        num_matches = len(matches)
-        # Empty response, no default
-        if response == '' and default is None:
-            stream.write("[!] an empty response is not valid.\n")
-        elif response == '':
-            selection = default
-        # Bad response
-        elif num_matches == 0:
-            stream.write("[!] \"{response}\" does not match any of the valid choices.\n".format(
-                response=response
-            ))
-        # One match
-        elif num_matches == 1:
-            selection = matches[0]
-        # Multiple matches
-        else:
-            # look for an exact match
-            selection = _exact_match(response, matches, insensitive, fuzzy)
-            # Multiple matches left
-            if selection is None:
-                stream.write("[!] \"{response}\" matches multiple choices:\n".format(
-                    response=response
-                ))
-                for match in matches:
-                    stream.write("[!]   {}\n".format(match))
-                stream.write("[!] Please specify your choice further.\n")
-    return selection
+    if indexed and response.isdigit():
+        index_response = int(response)
+        if index_response < len(table):
+            return index_response, []
+    # Empty response - the default, if there is one
+    if response == '':
+        return (None if default is None else table.find(default)), []
+    # Check for text matches.  The table handles insensitivity.
+    match_indices = table.match_indices(response)
+    # One match
+    if len(match_indices) == 1:
+        return match_indices[0], []
+    # Multiple matches - look for an exact match
+    if match_indices:
+        exact_index = table.exact_index(response, match_indices)
+        if exact_index is not None:
+            return exact_index, []
+    return None, match_indices
+
+
+def _match_score(r_key, r_words, key, words):
+    '''
+    Score how well an item's key matches the response key (lower is better):
+        0 -  the whole key.
+        1 -  a prefix of the key.
+        2 -  each response word starts a word of the key.
+        3 -  anywhere else in the key.
+    '''
+    if key == r_key:
+        return 0
+    if key.startswith(r_key):
+        return 1
+    if all(any(word.startswith(fragment) for word in words) for fragment in r_words):
+        return 2
+    return 3
+
+
+def _best_match_indices(response, table, match_indices, limit):
+    '''
+    Return the indices of the best (at most) limit matches, best first.
+    Matches are ranked by their score (see _match_score), then the shortest key, then item
+    order.  They are chosen with a bounded heap, so ranking many matches to show a few costs
+    little more than looking at them.
+    '''
+    r_key = table.key(response)
+    r_words = r_key.split()
+    keys = table.keys
+    item_words = table.words
+
+    def _rank(index):
+        '''The sort key for the item at the index.'''
+        key = keys[index]
+        words = key.split() if item_words is None else item_words[index]
+        return (_match_score(r_key, r_words, key, words), len(key), index)
+    return _heapq.nsmallest(limit, match_indices, key=_rank)
+
+
+def _explain_response(response, table, match_indices, stream, max_matches_shown=None):
+    '''
+    Explain to the user why the response (matching the indexed items) selected nothing.
+    If there are more than max_matches_shown matches, only the best are shown.
+    '''
+    # Empty response, no default
+    if response == '':
+        stream.write("[!] an empty response is not valid.\n")
+    # Bad response
+    elif not match_indices:
+        stream.write("[!] \"{response}\" does not match any of the valid choices.\n".format(
+            response=response
+        ))
+    # Multiple matches left
+    else:
+        lines = ["[!] \"{response}\" matches multiple choices:".format(response=response)]
+        shown_indices = match_indices
+        if max_matches_shown is not None and len(match_indices) > max_matches_shown:
+            shown_indices = _best_match_indices(
+                response, table, match_indices, max_matches_shown
+            )
+        lines.extend("[!]   {}".format(table.texts[index]) for index in shown_indices)
+        if len(shown_indices) < len(match_indices):
+            lines.append("[!]   ...and {} more.".format(len(match_indices) - len(shown_indices)))
+        lines.append("[!] Please specify your choice further.")
+        # one write, however many matches there are
+        stream.write('\n'.join(lines) + '\n')
+
+
+def _check_response(response, table, default, indexed, stream, max_matches_shown=None):
+    '''
+    Check the response against the item table, and explain any failure to the user.
+    If there are more than max_matches_shown matches, only the best are shown.
+    '''
+    selected_index, match_indices = _match_response(response, table, default, indexed)
+    if selected_index is None:
+        _explain_response(response, table, match_indices, stream, max_matches_shown)
+        return None
+    return table.texts[selected_index]
 
 
 def _check_prompts(pre_prompt, post_prompt):
@@ -382,20 +1678,27 @@ def _check_prompts(pre_prompt, post_prompt):
 def _check_items(items):
     '''
     Check:
-     - that the list of items is iterable and finite.
-     - that the list is not empty
+     - that the list of items is iterable.
+     - that the list is not empty, if it is finite (has a length).
     '''
-    num_items = 0
-    # Check that the list is iterable and finite
+    # Check that the list is iterable
     try:
-        num_items = len(items)
-    except:
-        raise TypeError("The item list ({}) is not a finite iterable (has no length)".format(items))
+        iter(items)
+    except TypeError:
+        raise TypeError("The item list ({}) is not iterable".format(items))
     # Check that the list has items
-    if num_items == 0:
+    if _is_stream(items):
+        # streams can only be checked once they're loaded
+        return
+    if len(items) == 0:
         raise ValueError("The item list is empty.")
 
 
+def _is_stream(items):
+    '''Return True if the items are a stream: an iterable with no length.'''
+    return not hasattr(items, '__len__')
+
+
 def _check_default_index(items, default_index):
     '''Check that the default is in the list, and not empty'''
     num_items = len(items)
@@ -409,20 +1712,59 @@ def _check_default_index(items, default_index):
         raise ValueError("The default index ({}) points to an empty item.".format(default_index))
 
 
+def _check_page_size(page_size):
+    '''Check that the page size, if given, is a positive integer'''
+    if page_size is not None and not isinstance(page_size, int):
+        raise TypeError("The page size ({}) is not an integer".format(page_size))
+    if page_size is not None and page_size < 1:
+        raise ValueError("The page size ({}) < 1.".format(page_size))
+
+
+def _check_max_matches_shown(max_matches_shown):
+    '''Check that the max matches shown, if given, is a positive integer'''
+    if max_matches_shown is not None and not isinstance(max_matches_shown, int):
+        raise TypeError("The max matches shown ({}) is not an integer".format(max_matches_shown))
+    if max_matches_shown is not None and max_matches_shown < 1:
+        raise ValueError("The max matches shown ({}) < 1.".format(max_matches_shown))
+
+
+def _check_processes(processes):
+    '''Check that the number of processes is None or a positive integer'''
+    if processes is None:
+        return
+    if not isinstance(processes, int):
+        raise TypeError("The processes given ({}) is not an integer.".format(processes))
+    if processes < 1:
+        raise ValueError("The processes given ({}) is not positive.".format(processes))
+
+
 def _check_stream(stream):
     '''Check that the stream is a file'''
     if not isinstance(stream, type(_sys.stderr)):
         raise TypeError("The stream given ({}) is not a file object.".format(stream))
 
 
-def _cli():
-    '''CLI interface'''
+def _cli(argv=None, tty='/dev/tty'):
+    '''
+    CLI interface
+
+    A daemon runs it for its clients' argv (see pimento._daemon), with the file descriptor of
+    the tty they passed it as the tty, or None if they have none.
+    '''
+    # hand the menu over to a daemon, if there's one listening (see --daemon)
+    if argv is None and _os.environ.get('PIMENTO_SOCKET') and '--daemon' not in _sys.argv:
+        if _sys.version_info >= (3, 3) and hasattr(_os, 'fork'):
+            from ._daemon import _forward
+            status = _forward(_os.environ['PIMENTO_SOCKET'], _sys.argv[1:])
+            if status is not None:
+                exit(status)
+    import argparse as _argparse
     parser = _argparse.ArgumentParser(
         description='''
             Present the user with a simple CLI menu, and return the option chosen.
             The menu is presented via stderr.
             The output is printed to stdout for piping.
-            '''.format(_VERSION),
+            ''',
         epilog='''
             The default for the post prompt is "Enter an option to continue: ".
             If --default-index is specified, the default option value will be printed
@@ -475,36 +1817,171 @@ def _cli():
         help='search for the individual words in the user input anywhere in the item strings.',
         action='store_true'
     )
+    parser.add_argument(
+        '--page-size',
+        help="Show at most INT options at a time.  Enter '>' or '<' to change pages.",
+        type=int,
+        metavar='INT'
+    )
+    parser.add_argument(
+        '--no-reprint',
+        help='Do not show the menu again after an invalid response - just the error and the post prompt.',
+        action='store_true'
+    )
+    parser.add_argument(
+        '--max-shown',
+        help='Show at most INT of the matches to an ambiguous response - the best ones.',
+        type=int,
+        metavar='INT'
+    )
+    parser.add_argument(
+        '--live',
+        help='Filter the options as the response is typed, and select the highlighted one on Enter.',
+        action='store_true'
+    )
+    parser.add_argument(
+        '--compact',
+        help='Store the options compactly: less memory for huge menus, but slower matching.',
+        action='store_true'
+    )
+    parser.add_argument(
+        '--processes',
+        help='Check fuzzy matches on a pool of INT processes, when there are enough items.',
+        type=int,
+        metavar='INT'
+    )
+    parser.add_argument(
+        '--cache-dir',
+        help=(
+            'Cache the prepared options in DIR, so that later menus of the same options start'
+            + ' faster.  Piped options are read in whole first.  [$PIMENTO_CACHE_DIR]'
+        ),
+        default=_os.environ.get('PIMENTO_CACHE_DIR') or None,
+        metavar='DIR'
+    )
+    parser.add_argument(
+        '--stats',
+        help='Write timings and counts for the menu to FILE, as a line of JSON per event.',
+        metavar='FILE'
+    )
+    parser.add_argument(
+        '--batch',
+        help=(
+            "Don't prompt: resolve each line of FILE ('-' for stdin) as a response, and print"
+            + ' a tab-separated result for each: "selected", the response and the selection;'
+            + ' "ambiguous", the response and its matches; or "no-match" and the response.'
+        ),
+        metavar='FILE'
+    )
+    parser.add_argument(
+        '--from-file',
+        help=(
+            'Read more options from the lines of PATH.  The file is memory-mapped, and only'
+            + ' the options shown or matched are read into memory.'
+        ),
+        metavar='PATH'
+    )
+    parser.add_argument(
+        '--null', '-0',
+        help='Options from stdin or --from-file are separated by NULs (as from find -print0), not newlines.',
+        action='store_true'
+    )
     parser.add_argument(
         '--stdout',
         help='Use stdout for interactive output (instead of the default: stderr).',
         action='store_true'
     )
+    parser.add_argument(
+        '--daemon',
+        help=(
+            "Don't show a menu: serve menus for other pimento commands from the socket, keeping"
+            + ' their prepared options in memory.  Commands use the daemon when $PIMENTO_SOCKET'
+            + ' is set to its socket.'
+        ),
+        action='store_true'
+    )
+    parser.add_argument(
+        '--socket',
+        help='The Unix socket for --daemon to listen on.  [$PIMENTO_SOCKET]',
+        default=_os.environ.get('PIMENTO_SOCKET') or None,
+        metavar='PATH'
+    )
+    parser.add_argument(
+        '--idle-timeout',
+        help='Stop the daemon after SECONDS without a menu to serve. [%(default)s]',
+        type=float,
+        default=600,
+        metavar='SECONDS'
+    )
     # parse options
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     # argparse nargs is awkward.  Translate to be a proper plural.
     options = args.option
     # set the stream
     stream = _sys.stdout if args.stdout else _sys.stderr
     # if version, print version and exit
     if args.version:
-        stream.write('Pimento - v{}\n'.format(_VERSION))
+        stream.write('Pimento - v{}\n'.format(_get_version()))
         exit(0)
+    # if daemon, serve menus until idle
+    if args.daemon:
+        if args.socket is None:
+            parser.error('--daemon needs a --socket (or $PIMENTO_SOCKET)')
+        if _sys.version_info < (3, 3) or not hasattr(_os, 'fork'):
+            parser.error('--daemon needs python 3.3+, on a system with fork')
+        from ._daemon import _serve
+        exit(_serve(args.socket, args.idle_timeout))
+    # read options from a file, if given
+    if args.from_file is not None:
+        try:
+            lines = _MappedLines(args.from_file, b'\0' if args.null else b'\n')
+        except (IOError, OSError) as e:
+            _sys.stdout.write("ERROR: {}\n".format(e))
+            exit(1)
+        # the options given as args come first - in one compact buffer with the file's lines,
+        # which are copied into it (rather than mapped) to follow them
+        if options:
+            options = _CompactStrings(o.rstrip() for o in options)
+            options.extend(lines)
+        else:
+            options = lines
+    # if batch, resolve the responses and exit
+    if args.batch is not None:
+        _cli_batch(options, args)
+        return
     # read more options from stdin if there are are any
     # but only if we're on a 'nix system with tty's
-    tty = '/dev/tty'
-    if not _sys.stdin.isatty() and _path.exists(tty):
-        if _sys.version_info.major == 3:
+    if not _sys.stdin.isatty() and tty is not None and _path.exists(tty):
+        # (the live menu doesn't use input)
+        if _sys.version_info.major == 3 and not args.live:
             stream.write('[!] python3 input bug - tab completion not available\n')
             stream.write('[!] python3 input bug - arrow support not available\n')
             stream.write('[!] only known workaround is to not pipe in.\n')
-        options += [l.rstrip() for l in _sys.stdin]
+        # stream them in, so the menu can be shown before stdin is exhausted
+        # (unless they're coming from a file instead, or need hashing for the cache)
+        if args.from_file is None:
+            options = _itertools.chain(options, _stdin_options(_sys.stdin, args.null))
+            if args.cache_dir is not None or _resident_tables is not None:
+                options = list(options)
+        else:
+            stream.write('[!] options piped in are ignored - they come from --from-file\n')
         # switch to the main tty
         # this solution (to being interactive after reading from pipe)
         # comes from: https://stackoverflow.com/questions/6312819/pipes-and-prompts-in-python-cli-scripts
         _sys.stdin = open(tty)
-    # show the menu
+    on_event = None
+    stats_file = None
     try:
+        # write the stats as they happen
+        if args.stats is not None:
+            import json as _json
+            stats_file = open(args.stats, 'a')
+
+            def on_event(event):
+                '''Write the event as a line of JSON'''
+                stats_file.write(_json.dumps(event, sort_keys=True) + '\n')
+                stats_file.flush()
+        # show the menu
         result = menu(
             options,
             pre_prompt=args.pre,
@@ -513,7 +1990,15 @@ def _cli():
             indexed=args.indexed,
             insensitive=args.insensitive,
             fuzzy=args.fuzzy,
-            stream=stream
+            stream=stream,
+            page_size=args.page_size,
+            reprint=not args.no_reprint,
+            processes=args.processes,
+            max_matches_shown=args.max_shown,
+            on_event=on_event,
+            compact=args.compact,
+            cache_dir=args.cache_dir,
+            live=args.live
         )
         # print the result (to stdout)
         _sys.stdout.write(result + '\n')
@@ -523,6 +2008,167 @@ def _cli():
     except Exception as e:
         _sys.stdout.write("ERROR: {}\n".format(e))
         exit(1)
+    finally:
+        if stats_file is not None:
+            stats_file.close()
+
+
+def _stdin_options(stdin, null):
+    '''
+    Generate the rstripped options from stdin (which the CLI may replace with the tty, once
+    it's started reading), one per line - or, if null, separated by NULs.
+    '''
+    if not null:
+        for line in stdin:
+            yield line.rstrip()
+        return
+    binary = getattr(stdin, 'buffer', stdin)
+    pending = b''
+    while True:
+        data = binary.read1(65536) if hasattr(binary, 'read1') else binary.read(65536)
+        if not data:
+            break
+        parts = (pending + data).split(b'\0')
+        pending = parts.pop()
+        for part in parts:
+            yield _decode_option(part)
+    if pending:
+        yield _decode_option(pending)
+
+
+def _decode_option(data):
+    '''Decode an option read as bytes, and rstrip it (as _MappedLines does).'''
+    if _sys.version_info.major == 2:
+        return data.rstrip()
+    return data.decode('utf-8', 'surrogateescape').rstrip()
+
+
+def _cli_batch(options, args):
+    '''CLI batch mode: resolve responses from a file (or stdin) without prompting'''
+    responses = _sys.stdin
+    try:
+        if args.batch != '-':
+            responses = open(args.batch)
+            # read more options from stdin if there are any (and no file of them)
+            if not _sys.stdin.isatty():
+                if args.from_file is None:
+                    options = _itertools.chain(options, _stdin_options(_sys.stdin, args.null))
+                else:
+                    _sys.stderr.write(
+                        '[!] options piped in are ignored - they come from --from-file\n'
+                    )
+        resolutions = resolve(
+            (r.rstrip('\r\n') for r in responses),
+            options,
+            insensitive=args.insensitive,
+            fuzzy=args.fuzzy,
+            indexed=args.indexed,
+            processes=args.processes,
+            compact=args.compact,
+            cache_dir=args.cache_dir
+        )
+        for response, selection, matches in resolutions:
+            if selection is not None:
+                fields = ['selected', response, selection]
+            elif matches:
+                fields = ['ambiguous', response] + matches
+            else:
+                fields = ['no-match', response]
+            _sys.stdout.write('\t'.join(fields) + '\n')
+    except Exception as e:
+        _sys.stdout.write("ERROR: {}\n".format(e))
+        exit(1)
+    finally:
+        if responses is not _sys.stdin:
+            responses.close()
+
+
+def _resolutions(responses, table, indexed):
+    '''Generate the resolutions of the responses against the item table, for resolve'''
+    try:
+        for response in responses:
+            selected_index, match_indices = _match_response(response, table, None, indexed)
+            if selected_index is None:
+                yield response, None, [table.texts[i] for i in match_indices]
+            else:
+                yield response, table.texts[selected_index], []
+    finally:
+        table.close()
+
+
+def _compile_table(items, insensitive, fuzzy, processes, compact, cache_dir, timer):
+    '''
+    Compile the (finite) items into an item table, as the menu does: convert them to rstripped
+    strings, deduplicate them, remove the empty ones, and index them.  Mapped lines are already
+    rstripped strings, and the table removes their duplicates and empty lines itself, so that
+    they're never all decoded at once.
+
+    With a cache directory, the table is loaded from the cache instead, if it's there, and
+    stored in it, if not (see _TableCache).
+
+    timer -  a function returning a _PhaseTimer for a phase, to time each phase with.
+    '''
+    cache = None
+    resident = _resident_tables
+    if cache_dir is not None or resident is not None:
+        with timer('cache_load') as load_timer:
+            if not isinstance(items, (list, tuple, _CompactStrings)):
+                # hashing them and compiling them are two passes
+                items = list(items)
+            key = _table_key(items, insensitive, fuzzy, compact)
+            table = None
+            if resident is not None:
+                table = resident.get(key)
+                if table is not None:
+                    _resident_log.append((key, None))
+            if table is None and cache_dir is not None:
+                cache = _TableCache(cache_dir)
+                table = cache.load(key)
+                if table is not None and resident is not None:
+                    _resident_log.append((key, table))
+            load_timer.fields['hit'] = table is not None
+        if table is not None:
+            table.processes = processes
+            return table
+    if isinstance(items, _CompactStrings):
+        with timer('index'):
+            table = _ItemTable(items, insensitive, fuzzy, processes=processes, compact=True)
+        with timer('dedup'):
+            table.remove_redundant()
+    else:
+        # - convert items to rstripped strings
+        with timer('convert'):
+            items = [str(i).rstrip() for i in items]
+        # - deduplicate items, and remove empty options
+        with timer('dedup'):
+            items = [i for i in _dedup(items, insensitive) if i]
+        # - re-check the items
+        _check_items(items)
+        # - normalize and index the items for matching
+        with timer('index'):
+            table = _ItemTable(items, insensitive, fuzzy, processes=processes, compact=compact)
+    _check_items(table.texts)
+    if cache is not None or resident is not None:
+        # the sorted keys are built lazily - build them now, so they're cached too
+        table._sort_new()
+    if resident is not None:
+        _resident_log.append((key, table))
+    if cache is not None:
+        with timer('cache_store'):
+            cache.store(key, table)
+    return table
+
+
+def _keep_tables_resident():
+    '''
+    Keep the item tables compiled from now on in memory, for a daemon's menus (see
+    _compile_table), and return the dict they're kept in, by key.
+    '''
+    global _resident_tables
+    if _resident_tables is None:
+        import collections as _collections
+        _resident_tables = _collections.OrderedDict()
+    return _resident_tables
 
 
 def _dedup(items, insensitive):
@@ -533,23 +2179,27 @@ def _dedup(items, insensitive):
     a prior item.
     '''
     deduped = []
+    # the keys seen so far - case-folded for insensitive lists
+    seen = set()
     if insensitive:
-        i_deduped = []
         for item in items:
-            lowered = item.lower()
-            if lowered not in i_deduped:
+            folded = _fold(item)
+            if folded not in seen:
                 deduped.append(item)
-                i_deduped.append(lowered)
+                seen.add(folded)
     else:
         for item in items:
-            if item not in deduped:
+            if item not in seen:
                 deduped.append(item)
+                seen.add(item)
     return deduped
 
 
 # [ Public API ]
 def menu(items, pre_prompt="Options:", post_prompt=_NO_ARG, default_index=None, indexed=False,
-         stream=_sys.stderr, insensitive=False, fuzzy=False, quiet=False):
+         stream=_sys.stderr, insensitive=False, fuzzy=False, quiet=False, page_size=None,
+         reprint=True, processes=None, max_matches_shown=None, on_event=None, compact=False,
+         cache_dir=None, live=False):
     '''
     Prompt with a menu.
 
@@ -564,6 +2214,28 @@ def menu(items, pre_prompt="Options:", post_prompt=_NO_ARG, default_index=None,
         insensitive -  allow insensitive matching.  Also drops items which case-insensitively match
           prior items.
         fuzzy -  search for the individual words in the user input anywhere in the item strings.
+        page_size -  show at most this many items at a time.  Entering '>' or '<' shows the next
+            or previous page.
+        reprint -  show the menu again after an invalid response.  If False, only the error
+            and the post prompt are shown again.
+        processes -  check fuzzy matches on a pool of this many processes, when there are
+            enough items to make it worthwhile.
+        max_matches_shown -  when a response matches more items than this, show only the best
+            matches (whole, then prefix, then word-start, then other matches, shortest first),
+            and how many more there are.
+        on_event -  called with a dict for each instrumented event, which can be dumped as
+            JSON.  Its 'event' is one of the timed phases ('validate', 'cache_load',
+            'convert', 'dedup', 'index', 'cache_store', 'render', 'check_response',
+            'completion', 'keystroke'), with the 'seconds' it took, or 'ask', with the totals for the
+            prompt (see the README).
+        compact -  store the items compactly, for huge menus: less memory, slower matching.
+        cache_dir -  a directory to cache the prepared (deduplicated and indexed) items in, so
+            that later menus of the same items, with the same settings, start faster.  The
+            least recently used items are removed once the cache is full.  Streamed items
+            aren't cached.
+        live -  filter the items as the response is typed, showing the matches that fit on the
+            terminal, and select the highlighted one (or what the response selects) on Enter.
+            Needs an interactive terminal (and termios) - otherwise the usual prompt is used.
 
     Specifying a default index:
         The default index must index into the items.  In other words, `items[default_index]`
@@ -580,75 +2252,346 @@ def menu(items, pre_prompt="Options:", post_prompt=_NO_ARG, default_index=None,
     Return:
         result -  The full text of the unambiguously selected item.
     '''
+    compiled_menu = Menu(
+        items, pre_prompt, post_prompt, default_index, indexed, stream, insensitive, fuzzy,
+        quiet, page_size, reprint, processes, max_matches_shown, on_event, compact, cache_dir,
+        live
+    )
+    try:
+        return compiled_menu.ask()
+    finally:
+        compiled_menu.close()
+
+
+def resolve(responses, items, insensitive=False, fuzzy=False, indexed=False, processes=None,
+            compact=False, cache_dir=None):
+    '''
+    Resolve responses against the items, as a menu would, without prompting.
+
+    Arguments:
+        responses -  An iterable of responses to resolve.  It may be a stream (a file, a
+            generator): each response is resolved as it arrives.
+        items -  The items to match the responses against.  They are converted, deduplicated
+            and stripped of empty items just as menu does, once for all of the responses.
+        insensitive -  allow insensitive matching.  Also drops items which case-insensitively match
+          prior items.
+        fuzzy -  search for the individual words in the user input anywhere in the item strings.
+        indexed -  Boolean.  True if responses may select an item by its index.
+        processes -  check fuzzy matches on a pool of this many processes, as for menu.
+        compact -  store the items compactly, as for menu.
+        cache_dir -  cache the prepared items in this directory, as for menu.
+
+    Return:
+        resolutions -  An iterator of (response, selection, matches) tuples, one per response:
+            selection -  the selected item, or None if the response did not select one.
+            matches -  if there was no selection, the items the response matched: several if
+                it was ambiguous, none if it was invalid.
+    '''
     # arg checking
-    _check_prompts(pre_prompt, post_prompt)
     _check_items(items)
-    _check_default_index(items, default_index)
-    _check_stream(stream)
-    # arg mapping
-    # - Fill in post-prompt dynamically if no arg
-    actual_post_prompt = post_prompt
-    if post_prompt is _NO_ARG:
-        if default_index is None:
-            actual_post_prompt = "Enter an option to continue: "
-        else:
-            actual_post_prompt = "Enter an option to continue [{}]: "
-    # - convert items to rstripped strings
-    items = [str(i).rstrip() for i in items]
-    # - set the default argument
-    default = None
-    if default_index is not None:
-        default = items[default_index]
-    # - deduplicate items
-    items = _dedup(items, insensitive)
-    # - remove empty options
-    items = [i for i in items if i]
-    # - re-check the items
-    _check_items(items)
-    # other state init
-    acceptable_response_given = False
-    if _readline is None:
-        stream.write('[!] readline library not present - tab completion not available\n')
-        stream.write('[!] readline library not present - arrow support not available\n')
-    elif not stream.isatty():
-        stream.write('[!] output stream is not interactive - tab completion not available\n')
-        stream.write('[!] output stream is not interactive - arrow support not available\n')
-    elif _sys.version_info.major == 3 and stream is not _sys.stdout:
-        stream.write('[!] python3 input bug (issue24402) - tab completion not available\n')
-        stream.write('[!] python3 input bug (issue24402) - arrow support not available\n')
-        stream.write('[!] set sys.stdout as the stream to work around\n')
-    else:
-        _tab_complete_init(items, actual_post_prompt, insensitive, fuzzy, stream)
-    # Set both stdout and stderr to the stream selected.
-    # - in py2, raw_input uses sys.stdout
-    # - in py3, input uses a lower-level stdout stream which is not redirectable.
-    #   - there is an open bug for this, scheduled to be resolved in py3.6 (https://bugs.python.org/issue24402)
-    # [raw_]input uses readline to do fancy things like tab completion, and also like reprinting the user
-    # text on the cli when you type.  If we don't redirect the output streams, [raw_]input will always use
-    # the default (stdout) even though most of the time we want stderr for interactive prompts.  we could just
-    # print the prompt ourselves (and not let [raw_]input do so), but only when we control reprinting (which
-    # we don't always for tab completion), and even then, if the user backspaces into the prompt, [raw_]input
-    # would reprint the line itself, erasing the prompt it doesn't know about.  (see issue #70)
-    try:
-        _old_stdout = _sys.stdout
-        _old_stderr = _sys.stderr
-        # only overwrite the stream if we need to, due to the python3 issue
-        if stream is _sys.stdout:
-            pass
+    _check_processes(processes)
+    # arg mapping - as for menu
+    table = _compile_table(
+        items, insensitive, fuzzy, processes, compact, cache_dir,
+        lambda phase: _PhaseTimer(None, phase)
+    )
+    return _resolutions(responses, table, indexed)
+
+
+class Menu(object):
+    '''
+    A menu which can be asked more than once.
+
+    The items are converted, deduplicated, indexed and rendered once, when the menu is
+    created, rather than each time it is asked.  Items can be added and removed without
+    starting over.
+
+    Arguments:
+        The same as for the menu function.
+
+    Methods:
+        ask() -  Prompt with the menu, and return the selected item, as the menu function does.
+        add(items) -  Add the items to the end of the menu, as they would have been if they
+            were at the end of the original items: converted to strings, rstripped, and
+            dropped if they are duplicates or empty.
+        remove(items) -  Remove the items from the menu.  If the default is removed, the menu
+            no longer has one.
+        close() -  Shut down the fuzzy matching processes, if any were started.
+    '''
+    def __init__(self, items, pre_prompt="Options:", post_prompt=_NO_ARG, default_index=None,
+                 indexed=False, stream=_sys.stderr, insensitive=False, fuzzy=False, quiet=False,
+                 page_size=None, reprint=True, processes=None, max_matches_shown=None,
+                 on_event=None, compact=False, cache_dir=None, live=False):
+        '''Check the arguments, and compile the items.'''
+        self._on_event = on_event
+        # arg checking
+        with self._timer('validate'):
+            _check_prompts(pre_prompt, post_prompt)
+            _check_items(items)
+            _check_stream(stream)
+            _check_page_size(page_size)
+            _check_processes(processes)
+            _check_max_matches_shown(max_matches_shown)
+            # - start loading streamed items
+            loader = None
+            if _is_stream(items):
+                loader = _ItemLoader(items, default_index)
+                # check the default once it has loaded
+                loader.wait(lambda: len(loader.head) >= loader.head_size)
+                _check_default_index(loader.head, default_index)
+            else:
+                _check_default_index(items, default_index)
+        # arg mapping
+        self.pre_prompt = pre_prompt
+        self.post_prompt = post_prompt
+        self.indexed = indexed
+        self.stream = stream
+        self.page_size = page_size
+        self.reprint = reprint
+        self.max_matches_shown = max_matches_shown
+        self.live = live
+        # everything but the menu input goes through the output buffer
+        self._output = _OutputBuffer(stream)
+        if loader is None:
+            # - set the default argument
+            self.default = None
+            if default_index is not None:
+                self.default = str(items[default_index]).rstrip()
+            self.table = _compile_table(
+                items, insensitive, fuzzy, processes, compact, cache_dir, self._timer
+            )
         else:
-            _sys.stdout = stream
-        # Prompt Loop
-        # - wait until an acceptable response has been given
-        while not acceptable_response_given:
+            # the loader does all of the above as the items arrive
+            self.default = None
+            if default_index is not None:
+                self.default = loader.head[default_index]
+            self.table = _ItemTable([], insensitive, fuzzy, loader, processes, compact)
+            # give the stream a moment to finish, so short streams are shown whole
+            loader.wait(lambda: False, _STREAM_WAIT)
+            self.table.refresh()
+            # wait for something to show
+            while not len(self.table) and self.table.loading():
+                loader.wait(loader.has_new)
+                self.table.refresh()
+            _check_items(self.table.texts)
+        # the rendered menu, and what it was rendered from
+        self._rendered_menu = None
+        self._rendered_state = None
+        # the tab completer, and the post prompt it was made for
+        self._completer = None
+        self._completer_prompt = None
+        # the instrumentation for the current ask (see _start_ask)
+        self._ask_stats = None
+
+    def _timer(self, phase):
+        '''Return a timer for the phase, reporting to the on_event callback (see _PhaseTimer).'''
+        return _PhaseTimer(self._on_event, phase)
+
+    def _timed(self, phase, func):
+        '''Return a version of func which is timed as the phase, if there is an on_event callback.'''
+        if self._on_event is None:
+            return func
+
+        def _timed_func(*args):
+            '''Call func, timed.'''
+            with self._timer(phase):
+                return func(*args)
+        return _timed_func
+
+    def _start_ask(self):
+        '''Start the instrumentation for an ask.'''
+        self._ask_stats = {
+            'start': _clock(),
+            'writes': self._output.writes,
+            'bytes_written': self._output.bytes_written,
+            'responses': 0,
+            'retries': 0,
+            'matches': 0,
+        }
+
+    def _finish_ask(self):
+        '''
+        Report the totals for the ask to the on_event callback:
+            seconds -  from the start of the ask to the selection.
+            items -  the number of items in the menu.
+            responses -  the number of responses.
+            retries -  the number of responses which selected nothing (page changes aside).
+            matches -  the number of matches to the responses, in all.
+            writes, bytes_written -  the output written (see _OutputBuffer).
+        '''
+        stats = self._ask_stats
+        if self._on_event is None or stats is None:
+            return
+        self._on_event({
+            'event': 'ask',
+            'seconds': _clock() - stats['start'],
+            'items': len(self.table),
+            'responses': stats['responses'],
+            'retries': stats['retries'],
+            'matches': stats['matches'],
+            'writes': self._output.writes - stats['writes'],
+            'bytes_written': self._output.bytes_written - stats['bytes_written'],
+        })
+
+    def _actual_post_prompt(self):
+        '''Fill in the post-prompt dynamically if no arg'''
+        if self.post_prompt is not _NO_ARG:
+            return self.post_prompt
+        if self.default is None:
+            return "Enter an option to continue: "
+        return "Enter an option to continue [{}]: "
+
+    def _render(self, page):
+        '''Return the rendered menu for the page, rendering it only if it has changed.'''
+        table = self.table
+        menu_state = (table.version, table.loading(), page, self.default)
+        if menu_state != self._rendered_state:
+            with self._timer('render'):
+                menu_text = _render_menu(
+                    self.pre_prompt, table.texts, self.default, self.indexed, table.loading(),
+                    self.page_size, page
+                )
+                self._rendered_menu = (menu_text, _encode_menu(menu_text, self.stream))
+            self._rendered_state = menu_state
+        return self._rendered_menu
+
+    def add(self, items):
+        '''Add the items to the end of the menu (see the class documentation).'''
+        self.table.refresh()
+        self.table.add([str(i).rstrip() for i in items])
+
+    def remove(self, items):
+        '''Remove the items from the menu (see the class documentation).'''
+        table = self.table
+        table.refresh()
+        indices = [table.find(str(i).rstrip()) for i in items]
+        table.remove_indices(i for i in indices if i is not None)
+        if self.default is not None and table.find(self.default) is None:
+            self.default = None
+
+    def _respond(self, response, page):
+        '''
+        Act on a response to the menu: change the page, or check it against the items.
+        Return (selection, page, show_menu):
+            selection -  the selected item, or None if the menu should be asked again.
+            page -  the page to show next.
+            show_menu -  whether to show the menu again, or just the post prompt.
+        '''
+        table = self.table
+        # page commands
+        if self.page_size is not None and response in (_NEXT_PAGE, _PREVIOUS_PAGE):
+            last_page = max(0, (len(table) - 1) // self.page_size)
+            if response == _NEXT_PAGE:
+                page = min(page + 1, last_page)
+            else:
+                page = max(page - 1, 0)
+            return None, page, True
+        # an empty response while the items are still loading just shows the items
+        # loaded so far
+        table.refresh()
+        if response == '' and self.default is None and table.loading():
+            return None, page, True
+        # validate response
+        with self._timer('check_response') as timer:
+            selected_index, match_indices = _match_response(
+                response, table, self.default, self.indexed
+            )
             selection = None
-            # Prompt and get response
-            response = _prompt(pre_prompt, items, actual_post_prompt, default, indexed, stream)
-            # validate response
-            selection = _check_response(response, items, default, indexed, stream, insensitive, fuzzy)
-            # NOTE: acceptable response logic is purposely verbose to be clear about the semantics.
-            if selection is not None:
-                acceptable_response_given = True
-    finally:
-        _sys.stdout = _old_stdout
-        _sys.stderr = _old_stderr
-    return selection
+            if selected_index is None:
+                _explain_response(
+                    response, table, match_indices, self._output, self.max_matches_shown
+                )
+            else:
+                selection = table.texts[selected_index]
+            num_matches = len(match_indices) if selection is None else 1
+            timer.fields['matches'] = num_matches
+        stats = self._ask_stats
+        if stats is not None:
+            stats['responses'] += 1
+            stats['matches'] += num_matches
+            if selection is None:
+                stats['retries'] += 1
+        return selection, page, self.reprint
+
+    def close(self):
+        '''Shut down the fuzzy matching processes (see the class documentation).'''
+        self.table.close()
+
+    def ask(self):
+        '''Prompt with the menu, and return the selected item.'''
+        table = self.table
+        stream = self.stream
+        # the warnings go out with the menu
+        output = self._output
+        table.refresh()
+        _check_items(table.texts)
+        actual_post_prompt = self._actual_post_prompt()
+        # the live menu has a loop of its own
+        if self.live:
+            from ._live import _unavailable_reason, _ask_live
+            reason = _unavailable_reason(_sys.stdin, stream)
+            if reason is None:
+                return _ask_live(self, _sys.stdin.fileno())
+            output.write('[!] {} - live mode not available\n'.format(reason))
+        # other state init
+        selection = None
+        page = 0
+        show_menu = True
+        self._start_ask()
+        if _import_readline() is None:
+            output.write('[!] readline library not present - tab completion not available\n')
+            output.write('[!] readline library not present - arrow support not available\n')
+        elif not stream.isatty():
+            output.write('[!] output stream is not interactive - tab completion not available\n')
+            output.write('[!] output stream is not interactive - arrow support not available\n')
+        elif _sys.version_info.major == 3 and stream is not _sys.stdout:
+            output.write('[!] python3 input bug (issue24402) - tab completion not available\n')
+            output.write('[!] python3 input bug (issue24402) - arrow support not available\n')
+            output.write('[!] set sys.stdout as the stream to work around\n')
+        elif self._completer is None or self._completer_prompt != actual_post_prompt:
+            completer = _tab_complete_init(table, actual_post_prompt, output)
+            if self._on_event is not None:
+                completer = tuple(self._timed('completion', f) for f in completer)
+                _tab_complete_use(completer)
+            self._completer = completer
+            self._completer_prompt = actual_post_prompt
+        else:
+            _tab_complete_use(self._completer)
+        # Set both stdout and stderr to the stream selected.
+        # - in py2, raw_input uses sys.stdout
+        # - in py3, input uses a lower-level stdout stream which is not redirectable.
+        #   - there is an open bug for this, scheduled to be resolved in py3.6 (https://bugs.python.org/issue24402)
+        # [raw_]input uses readline to do fancy things like tab completion, and also like reprinting the user
+        # text on the cli when you type.  If we don't redirect the output streams, [raw_]input will always use
+        # the default (stdout) even though most of the time we want stderr for interactive prompts.  we could just
+        # print the prompt ourselves (and not let [raw_]input do so), but only when we control reprinting (which
+        # we don't always for tab completion), and even then, if the user backspaces into the prompt, [raw_]input
+        # would reprint the line itself, erasing the prompt it doesn't know about.  (see issue #70)
+        try:
+            _old_stdout = _sys.stdout
+            _old_stderr = _sys.stderr
+            # only overwrite the stream if we need to, due to the python3 issue
+            if stream is _sys.stdout:
+                pass
+            else:
+                _sys.stdout = stream
+            # Prompt Loop
+            # - wait until an acceptable response has been given
+            while selection is None:
+                # Prompt and get response
+                table.refresh()
+                response = _prompt(
+                    self._render(page) if show_menu else None, actual_post_prompt, self.default,
+                    output
+                )
+                selection, page, show_menu = self._respond(response, page)
+        finally:
+            _sys.stdout = _old_stdout
+            _sys.stderr = _old_stderr
+        self._finish_ask()
+        return selection
+
+
+# the asyncio menu needs python 3.5+ syntax, so it's in a module of its own
+if _sys.version_info >= (3, 5):
+    from ._async import amenu
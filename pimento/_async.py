@@ -0,0 +1,187 @@
+'''
+The asyncio menu (see amenu).
+
+This is a module of its own because its syntax is python 3.5+ only.  asyncio itself is
+imported when amenu is first called, so that importing pimento stays quick.
+'''
+
+
+# [ Imports ]
+# [ -Python ]
+import sys as _sys
+import os as _os
+import functools as _functools
+# [ -Project ]
+from . import (
+    Menu as _Menu, _NO_ARG, _is_stream, _format_post_prompt, _check_items
+)
+
+
+# [ GLOBALS ]
+# _EXECUTOR_THRESHOLD is the fewest items for which building, rendering and matching the menu
+# is run in the event loop's executor, rather than on the loop itself.
+_EXECUTOR_THRESHOLD=10000
+# _pending is the input read from each file descriptor (by number) past the end of the last
+# line returned, for the next line to start with.
+_pending={}
+
+
+# [ Private API ]
+def _is_async_iterable(items):
+    '''Return True if the items are an async iterable'''
+    return hasattr(items, '__aiter__')
+
+
+async def _collect(items):
+    '''Collect the items of an async iterable into a list'''
+    collected = []
+    async for item in items:
+        collected.append(item)
+    return collected
+
+
+async def _run(loop, in_executor, func, *args):
+    '''Run func(*args) - in the loop's default executor, if asked to.'''
+    if in_executor:
+        return await loop.run_in_executor(None, _functools.partial(func, *args))
+    return func(*args)
+
+
+def _take_line(fd, encoding, errors):
+    '''Take a line from the pending input for the fd, without its newline, or return None.'''
+    pending = _pending.get(fd, b'')
+    end = pending.find(b'\n')
+    if end < 0:
+        return None
+    _pending[fd] = pending[end + 1:]
+    return pending[:end].decode(encoding, errors).rstrip('\r')
+
+
+async def _read_line(loop, stdin):
+    '''
+    Read a line from stdin without blocking the event loop, and return it without its
+    newline.  Raise EOFError at the end of the input, as input does.
+
+    Where the loop can watch stdin's file descriptor, the descriptor is read directly, as it
+    becomes readable, so that waiting can be cancelled without leaving a read behind.
+    Otherwise (no descriptor, or an event loop which can't watch one), stdin is read in the
+    loop's executor.
+    '''
+    try:
+        fd = stdin.fileno()
+    except (AttributeError, ValueError, OSError):
+        fd = None
+    if fd is None or not hasattr(loop, 'add_reader'):
+        return await _read_line_in_executor(loop, stdin)
+    encoding = getattr(stdin, 'encoding', None) or 'utf-8'
+    errors = getattr(stdin, 'errors', None) or 'strict'
+    line = _take_line(fd, encoding, errors)
+    while line is None:
+        readable = loop.create_future()
+
+        def _set_readable():
+            '''Wake the reader, once.'''
+            if not readable.done():
+                readable.set_result(None)
+        try:
+            loop.add_reader(fd, _set_readable)
+        except NotImplementedError:
+            # the loop can't watch descriptors after all (windows' proactor loop)
+            return await _read_line_in_executor(loop, stdin)
+        try:
+            await readable
+        finally:
+            loop.remove_reader(fd)
+        data = _os.read(fd, 65536)
+        if not data:
+            # end of input - return any last, unterminated line
+            pending = _pending.pop(fd, b'')
+            if not pending:
+                raise EOFError
+            return pending.decode(encoding, errors).rstrip('\r')
+        _pending[fd] = _pending.get(fd, b'') + data
+        line = _take_line(fd, encoding, errors)
+    return line
+
+
+async def _read_line_in_executor(loop, stdin):
+    '''Read a line from stdin in the loop's executor (see _read_line).'''
+    line = await loop.run_in_executor(None, stdin.readline)
+    if not line:
+        raise EOFError
+    return line.rstrip('\r\n')
+
+
+async def _ask(loop, menu, stdin):
+    '''Ask the menu, asynchronously (see amenu).'''
+    in_executor = len(menu.table) >= _EXECUTOR_THRESHOLD or menu.table.loading()
+    output = menu._output
+    menu.table.refresh()
+    _check_items(menu.table.texts)
+    post_prompt = _format_post_prompt(menu._actual_post_prompt(), menu.default)
+    selection = None
+    page = 0
+    show_menu = True
+    menu._start_ask()
+    while selection is None:
+        menu.table.refresh()
+        if show_menu:
+            output.write_menu(await _run(loop, in_executor, menu._render, page))
+        # with no readline, the post prompt can go out with the menu
+        output.write(post_prompt)
+        output.flush()
+        response = await _read_line(loop, stdin)
+        selection, page, show_menu = await _run(
+            loop, in_executor, menu._respond, response, page
+        )
+    menu._finish_ask()
+    return selection
+
+
+# [ Public API ]
+async def amenu(items, pre_prompt="Options:", post_prompt=_NO_ARG, default_index=None,
+                indexed=False, stream=_sys.stderr, insensitive=False, fuzzy=False, quiet=False,
+                page_size=None, reprint=True, processes=None, max_matches_shown=None,
+                on_event=None, compact=False, timeout=None, cache_dir=None):
+    '''
+    Prompt with a menu, without blocking the event loop.
+
+    Arguments:
+        The same as for the menu function (apart from live), and:
+        items -  may also be an async iterable, which is collected before the menu is shown.
+        timeout -  the most seconds to wait for a selection, if any.  asyncio.TimeoutError is
+            raised if there isn't one in time.
+
+    The menu reads its responses from sys.stdin, as the menu function does, but without
+    readline: there is no tab completion or line editing.
+
+    Menus with many items are built, rendered and matched in the event loop's default
+    executor, so that other tasks keep running.  Cancelling the task cancels the menu.
+
+    Return:
+        result -  The full text of the unambiguously selected item.
+    '''
+    import asyncio as _asyncio
+    loop = _asyncio.get_event_loop()
+    if timeout is not None:
+        return await _asyncio.wait_for(
+            amenu(
+                items, pre_prompt, post_prompt, default_index, indexed, stream, insensitive,
+                fuzzy, quiet, page_size, reprint, processes, max_matches_shown, on_event,
+                compact, cache_dir=cache_dir
+            ),
+            timeout
+        )
+    if _is_async_iterable(items):
+        items = await _collect(items)
+    # streamed items are loaded in a thread, which the menu waits on
+    in_executor = _is_stream(items) or len(items) >= _EXECUTOR_THRESHOLD
+    menu = await _run(
+        loop, in_executor, _Menu, items, pre_prompt, post_prompt, default_index, indexed,
+        stream, insensitive, fuzzy, quiet, page_size, reprint, processes, max_matches_shown,
+        on_event, compact, cache_dir
+    )
+    try:
+        return await _ask(loop, menu, _sys.stdin)
+    finally:
+        menu.close()
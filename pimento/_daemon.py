@@ -0,0 +1,388 @@
+'''
+The pimento daemon (see --daemon), and the client which hands menus over to it.
+
+Short pimento commands spend most of their time starting python, importing, and preparing
+their options.  A daemon does all of that once: it listens on a Unix socket, and the pimento
+command, when $PIMENTO_SOCKET is set, just connects to it, and passes it its argv,
+environment, working directory and standard streams (and the terminal, if stdin is piped).
+
+The daemon forks a process for each command, which runs the CLI just as the command would
+have, on the command's own streams - so the output is the same - and sends back the exit
+status.  The forked process then sends the daemon the item tables it compiled, and the daemon
+keeps them in memory, so that later menus of the same options find them ready (see
+pimento._compile_table).
+
+This needs python 3.3+ (for passing file descriptors over sockets), and fork.
+'''
+
+
+# [ Imports ]
+# [ -Python ]
+import sys as _sys
+import os as _os
+import array as _array
+import json as _json
+import pickle as _pickle
+import signal as _signal
+import socket as _socket
+import stat as _stat
+import struct as _struct
+import time as _time
+# [ -Project ]
+from . import _cli, _keep_tables_resident, _resident_log
+
+
+# [ GLOBALS ]
+# _HEADER is the struct of the length of a request, which comes before it.
+_HEADER=_struct.Struct('!I')
+# _MAX_FDS is the most file descriptors a request passes: stdin, stdout, stderr, the tty, and
+# any given as /dev/fd/N arguments (see _fd_args).
+_MAX_FDS=16
+# _FD_PREFIX is how arguments name file descriptors, as from bash's process substitution.
+_FD_PREFIX='/dev/fd/'
+# _REQUEST_TIMEOUT is how long (in seconds) the daemon waits for a client to send its request.
+_REQUEST_TIMEOUT=5
+# _MAX_BYTES is the most the item tables the daemon keeps add up to (pickled), before the
+# least recently used are dropped.
+_MAX_BYTES=512 * 1024 * 1024
+
+
+# [ Private API ]
+def _fd_args(argv):
+    '''
+    Return the (argument index, file descriptor) of each argument which names one of this
+    process's file descriptors (as '/dev/fd/N', or '--option=/dev/fd/N'), which the daemon
+    couldn't open by name.
+    '''
+    fd_args = []
+    for index, arg in enumerate(argv):
+        name = arg.rpartition('=')[2]
+        if name.startswith(_FD_PREFIX) and name[len(_FD_PREFIX):].isdigit():
+            fd = int(name[len(_FD_PREFIX):])
+            try:
+                _os.fstat(fd)
+            except OSError:
+                continue
+            fd_args.append((index, fd))
+    return fd_args[:_MAX_FDS - 4]
+
+
+def _rename_fd_args(argv, fd_args, fds):
+    '''Rename the arguments which named the client's file descriptors for the passed ones.'''
+    argv = list(argv)
+    for index, position in fd_args:
+        prefix = argv[index][:argv[index].index(_FD_PREFIX)]
+        argv[index] = '{}{}{}'.format(prefix, _FD_PREFIX, fds[position])
+    return argv
+
+
+def _send_request(client, argv, fds, has_tty, fd_args=()):
+    '''
+    Send the request for a menu, and the file descriptors it runs on, to the daemon.
+    fd_args -  the (argument index, position in fds) of the file descriptors named by the argv.
+    '''
+    try:
+        cwd = _os.getcwd()
+    except OSError:
+        cwd = '/'
+    request = _json.dumps({
+        'argv': argv, 'cwd': cwd, 'env': dict(_os.environ), 'tty': has_tty,
+        'fd_args': list(fd_args)
+    }).encode('utf-8')
+    data = _HEADER.pack(len(request)) + request
+    sent = client.sendmsg(
+        [data], [(_socket.SOL_SOCKET, _socket.SCM_RIGHTS, _array.array('i', fds))]
+    )
+    client.sendall(data[sent:])
+
+
+def _receive_request(connection):
+    '''Receive a request from a client (see _send_request).  Return (request, fds).'''
+    fds = _array.array('i')
+    data, ancillary, _, _ = connection.recvmsg(
+        65536, _socket.CMSG_SPACE(_MAX_FDS * fds.itemsize)
+    )
+    for level, kind, fd_data in ancillary:
+        if level == _socket.SOL_SOCKET and kind == _socket.SCM_RIGHTS:
+            fds.frombytes(fd_data[:len(fd_data) - len(fd_data) % fds.itemsize])
+    while len(data) < _HEADER.size or len(data) < _HEADER.size + _HEADER.unpack_from(data)[0]:
+        more = connection.recv(65536)
+        if not more:
+            raise EOFError('The client hung up before sending its request.')
+        data += more
+    return _json.loads(data[_HEADER.size:].decode('utf-8')), list(fds)
+
+
+def _exit_status(code):
+    '''Return the exit status for a SystemExit code, as python would exit with it.'''
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+    _sys.stderr.write('{}\n'.format(code))
+    return 1
+
+
+def _run_menu(connection, request, fds, results):
+    '''
+    Run the CLI for the request, on its file descriptors, in a forked process, and send the
+    exit status to the client.  Then write the tables the menu compiled, or found, to the
+    results pipe, for the daemon to keep (see _keep).
+    '''
+    # leave the daemon's session, so that signals for its terminal don't reach the menu
+    _os.setsid()
+    _signal.signal(_signal.SIGINT, _signal.default_int_handler)
+    for target, fd in zip((0, 1, 2), fds):
+        _os.dup2(fd, target)
+    for name, fd, mode in (('stdin', 0, 'r'), ('stdout', 1, 'w'), ('stderr', 2, 'w')):
+        # the daemon's own streams are reused (they're on the same descriptors), if it has them
+        if getattr(_sys, name) is None:
+            setattr(_sys, name, _os.fdopen(fd, mode))
+    tty = fds[3] if request['tty'] else None
+    argv = _rename_fd_args(request['argv'], request['fd_args'], fds)
+    try:
+        _os.chdir(request['cwd'])
+    except OSError:
+        pass
+    _os.environ.clear()
+    _os.environ.update(request['env'])
+    # the client interrupts the menu by its pid
+    connection.sendall(_json.dumps({'pid': _os.getpid()}).encode('utf-8') + b'\n')
+    try:
+        _cli(argv, tty)
+        status = 0
+    except SystemExit as e:
+        status = _exit_status(e.code)
+    except BaseException:
+        import traceback as _traceback
+        _traceback.print_exc()
+        status = 1
+    finally:
+        _sys.stdout.flush()
+        _sys.stderr.flush()
+    connection.sendall(_json.dumps({'exit': status}).encode('utf-8') + b'\n')
+    connection.close()
+    if _resident_log:
+        data = _pickle.dumps([
+            (key, None if table is None else _pickle.dumps(table, _pickle.HIGHEST_PROTOCOL))
+            for key, table in _resident_log
+        ], _pickle.HIGHEST_PROTOCOL)
+        with _os.fdopen(results, 'wb') as results_file:
+            results_file.write(data)
+
+
+def _keep(tables, sizes, data):
+    '''
+    Keep the tables a menu sent back (see _run_menu), and mark the ones it found as recently
+    used.  Then drop the least recently used tables, until they add up to at most _MAX_BYTES.
+    '''
+    for key, pickled in _pickle.loads(data):
+        if pickled is None:
+            if key in tables:
+                tables.move_to_end(key)
+            continue
+        tables.pop(key, None)
+        tables[key] = _pickle.loads(pickled)
+        sizes[key] = len(pickled)
+    while tables and sum(sizes[key] for key in tables) > _MAX_BYTES:
+        key, _ = tables.popitem(last=False)
+        del sizes[key]
+
+
+def _is_socket(path):
+    '''Return True if the path is a Unix socket (and not, say, a file given by mistake).'''
+    try:
+        return _stat.S_ISSOCK(_os.lstat(path).st_mode)
+    except OSError:
+        return False
+
+
+def _listen(path):
+    '''
+    Return a socket listening at the path, which only this user can connect to, or None if
+    another daemon is already listening there.  Raise ValueError if something other than a
+    socket is there.
+    '''
+    if _os.path.lexists(path):
+        if not _is_socket(path):
+            raise ValueError('{} exists, and is not a socket'.format(path))
+        probe = _socket.socket(_socket.AF_UNIX, _socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+            return None
+        except OSError:
+            # left over from a daemon which didn't get to clean up
+            _os.remove(path)
+        finally:
+            probe.close()
+    server = _socket.socket(_socket.AF_UNIX, _socket.SOCK_STREAM)
+    old_umask = _os.umask(0o177)
+    try:
+        server.bind(path)
+    finally:
+        _os.umask(old_umask)
+    server.listen(16)
+    return server
+
+
+def _reap():
+    '''Reap the finished menu processes.'''
+    while True:
+        try:
+            pid, _ = _os.waitpid(-1, _os.WNOHANG)
+        except ChildProcessError:
+            return
+        if not pid:
+            return
+
+
+def _serve(path, idle_timeout):
+    '''
+    Serve menus from the socket at the path, until idle_timeout seconds pass without one.
+    Return the exit status.
+    '''
+    import selectors as _selectors
+    # what the menus would otherwise import each time, they now find imported (see _cli)
+    import argparse
+    import hashlib
+    try:
+        server = _listen(path)
+    except (ValueError, OSError) as e:
+        _sys.stderr.write('ERROR: {}\n'.format(e))
+        return 1
+    if server is None:
+        _sys.stderr.write('ERROR: a pimento daemon is already listening at {}\n'.format(path))
+        return 1
+    tables = _keep_tables_resident()
+    sizes = {}
+    # the results pipe from each menu process, to the chunks read from it
+    results = {}
+    selector = _selectors.DefaultSelector()
+    selector.register(server, _selectors.EVENT_READ)
+    last_request = _time.time()
+    try:
+        while True:
+            remaining = last_request + idle_timeout - _time.time()
+            if remaining <= 0:
+                return 0
+            for selected, _ in selector.select(remaining):
+                if selected.fileobj is server:
+                    last_request = _time.time()
+                    results_fd = _accept(server)
+                    if results_fd is not None:
+                        results[results_fd] = []
+                        selector.register(results_fd, _selectors.EVENT_READ)
+                    continue
+                chunk = _os.read(selected.fd, 65536)
+                if chunk:
+                    results[selected.fd].append(chunk)
+                    continue
+                selector.unregister(selected.fd)
+                _os.close(selected.fd)
+                data = b''.join(results.pop(selected.fd))
+                if data:
+                    try:
+                        _keep(tables, sizes, data)
+                    except Exception:
+                        # a menu which died part way through sending - just don't keep them
+                        pass
+            _reap()
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        selector.close()
+        server.close()
+        # (unless something else has taken its place)
+        if _is_socket(path):
+            try:
+                _os.remove(path)
+            except OSError:
+                pass
+
+
+def _accept(server):
+    '''
+    Accept a client, and fork a process to run its menu.  Return the read end of the pipe the
+    process sends its tables back on, or None if the client didn't send a request.
+    '''
+    connection, _ = server.accept()
+    fds = []
+    try:
+        connection.settimeout(_REQUEST_TIMEOUT)
+        request, fds = _receive_request(connection)
+        connection.settimeout(None)
+        if len(fds) != 3 + bool(request['tty']) + len(request['fd_args']):
+            return None
+        results_read, results_write = _os.pipe()
+        pid = _os.fork()
+        if not pid:
+            # the menu process never returns to the daemon's loop
+            status = 0
+            try:
+                server.close()
+                _os.close(results_read)
+                _run_menu(connection, request, fds, results_write)
+            except BaseException:
+                status = 1
+            finally:
+                _os._exit(status)
+        _os.close(results_write)
+        return results_read
+    except (OSError, EOFError, ValueError):
+        return None
+    finally:
+        connection.close()
+        for fd in fds:
+            _os.close(fd)
+
+
+def _forward(path, argv):
+    '''
+    Run the CLI for the argv on the daemon listening at the path, on this process's standard
+    streams, and the terminal, if stdin isn't one.  Return the exit status, or None if no
+    daemon is listening.
+    '''
+    client = _socket.socket(_socket.AF_UNIX, _socket.SOCK_STREAM)
+    try:
+        client.connect(path)
+    except OSError:
+        client.close()
+        return None
+    fds = [0, 1, 2]
+    tty = None
+    # the CLI switches to the terminal for responses if stdin is piped - so pass it along
+    if not _os.isatty(0) and _os.path.exists('/dev/tty'):
+        try:
+            tty = _os.open('/dev/tty', _os.O_RDWR)
+            fds.append(tty)
+        except OSError:
+            pass
+    # the arguments naming file descriptors are renamed for the daemon's copies of them
+    fd_args = []
+    for index, fd in _fd_args(argv):
+        fd_args.append((index, len(fds)))
+        fds.append(fd)
+    try:
+        _send_request(client, argv, fds, tty is not None, fd_args)
+    finally:
+        if tty is not None:
+            _os.close(tty)
+    replies = client.makefile('rb')
+    pid = None
+    # if the daemon goes away without saying
+    status = 1
+    while True:
+        try:
+            line = replies.readline()
+        except KeyboardInterrupt:
+            # the terminal interrupts this process, not the menu's - pass it on
+            if pid is not None:
+                _os.kill(pid, _signal.SIGINT)
+            continue
+        if not line:
+            break
+        reply = _json.loads(line.decode('utf-8'))
+        pid = reply.get('pid', pid)
+        status = reply.get('exit', status)
+    client.close()
+    return status
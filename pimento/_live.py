@@ -0,0 +1,534 @@
+'''
+The live menu (see the menu function's live argument): the matches are filtered as the
+response is typed, in a terminal in raw mode, and only the lines of the terminal which change
+are redrawn.
+
+The matches are found on a worker thread (see _MatchScheduler), so that the keys are read,
+and the matches found so far drawn, however long a search takes.
+
+The terminal handling (termios) is imported when a live menu is first asked, so that
+importing pimento stays quick, and it's only available on \\*nix.
+'''
+
+
+# [ Imports ]
+# [ -Python ]
+import sys as _sys
+import os as _os
+import heapq as _heapq
+import threading as _threading
+import time as _time
+# [ -Project ]
+from . import _fuzzily_matches, _match_response, _format_post_prompt, _clock, _STREAM_WAIT
+
+
+# [ GLOBALS ]
+# _SCAN_CHUNK is how many items a fuzzy search checks between checks for a newer response.
+_SCAN_CHUNK=1000
+# _FRAME is how long (in seconds) a search goes on before the matches found so far are drawn,
+# and how long a keystroke waits for the first of its matches.
+_FRAME=1.0 / 60
+# _KEYS maps the keys (and escape sequences) a live menu acts on to their actions.
+_KEYS={
+    '\r': 'enter', '\n': 'enter',
+    '\x7f': 'backspace', '\x08': 'backspace',
+    '\x15': 'clear',
+    '\x03': 'interrupt',
+    '\x04': 'eof',
+    '\x1b[A': 'up', '\x1bOA': 'up', '\x10': 'up',
+    '\x1b[B': 'down', '\x1bOB': 'down', '\x0e': 'down',
+}
+# _HIGHLIGHT and _NORMAL are the terminal codes to start and end the highlighted match.
+_HIGHLIGHT='\x1b[7m'
+_NORMAL='\x1b[0m'
+
+
+# [ Private API ]
+def _unavailable_reason(stdin, stream):
+    '''Return why a live menu can't be shown on the stdin and stream, or None if it can.'''
+    try:
+        import termios
+    except ImportError:
+        return 'terminal control (termios) not present'
+    try:
+        interactive = _os.isatty(stdin.fileno()) and stream.isatty()
+    except (AttributeError, ValueError, OSError):
+        interactive = False
+    if not interactive:
+        return 'input or output stream is not interactive'
+    return None
+
+
+class _Search(object):
+    '''
+    The search for the items matching the text of a live response.
+
+    Prefix matches are found all at once, from the sorted keys, and copied, so that the
+    search stays the same as the table changes.  Fuzzy matches are found a
+    chunk of items at a time (see step), in item order, so that the first ones can be shown
+    before the search is done, and the search can be dropped for the next keystroke.  Only the
+    candidates from the table's word index are checked - or, if the text extends the text of a
+    finished search, only that search's matches.
+
+    pinned -  the index of the item an indexed response selects by its index, if any.  It's
+      matched first.
+    done -  True once all of the matches are found.
+    '''
+    __slots__ = (
+        'table', 'text', 'version', 'pinned', 'done', '_matched', '_found', '_todo', '_r_words'
+    )
+
+    def __init__(self, table, text, indexed, previous=None):
+        '''Start the search.'''
+        self.table = table
+        self.text = text
+        self.version = table.version
+        self.pinned = None
+        if indexed and text.isdigit() and int(text) < len(table):
+            self.pinned = int(text)
+        # the indices of the prefix matches (of all of the items, for no text), in the order of
+        # the sorted keys, or None
+        self._matched = None
+        # the fuzzy matches found so far, in item order, and the indices left to check
+        self._found = []
+        self._todo = None
+        self.done = True
+        if not text:
+            self._matched = range(len(table))
+        elif not table.fuzzy:
+            start, end = table.prefix_range(text)
+            self._matched = table.sorted_indices[start:end]
+        else:
+            self._r_words = table.key(text).split()
+            if (
+                previous is not None and previous.done and previous._matched is None
+                and previous.version == table.version and text.startswith(previous.text)
+            ):
+                # a longer response can only match fewer items
+                self._todo = iter(previous._found)
+            elif self._r_words:
+                # only the items with a word containing each response word can match
+                self._todo = iter(sorted(table.word_index.candidates(self._r_words)))
+            else:
+                self._todo = iter(range(len(table)))
+            self.done = False
+
+    def step(self):
+        '''Check the next chunk of items, for a fuzzy search.'''
+        words = self.table.words
+        r_words = self._r_words
+        found = self._found
+        checked = 0
+        for index in self._todo:
+            if _fuzzily_matches(r_words, words[index]):
+                found.append(index)
+            checked += 1
+            if checked == _SCAN_CHUNK:
+                return
+        self.done = True
+
+    def count(self):
+        '''Return the number of matches found (so far, if the search isn't done).'''
+        if self._matched is not None:
+            return len(self._matched)
+        return len(self._found)
+
+    def first(self, count):
+        '''Return the indices of the first count matches (found so far), in item order.'''
+        if self._matched is None:
+            indices = self._found[:count]
+        elif not self.text:
+            indices = list(range(min(count, len(self._matched))))
+        else:
+            indices = _heapq.nsmallest(count, self._matched)
+        if self.pinned is not None:
+            indices = [self.pinned] + [i for i in indices if i != self.pinned][:count - 1]
+        return indices
+
+
+class _MatchScheduler(object):
+    '''
+    Runs the searches for a live menu's responses on a worker thread, newest first.
+
+    Each response submitted supersedes the last: the search for it is dropped between chunks
+    (see _Search.step), rather than run to the end.  The search is published after each
+    chunk (as search), so the menu can draw the matches found so far.  The menu waits for the
+    wake fd to be readable, rather than polling, and then calls drain.
+
+    While the scheduler runs, the worker thread is the only one to change the item table: it
+    adds any items loaded since the last search (see _ItemTable.refresh), and searches again
+    if there are any.  The menu's thread only reads the searches published, which keep their
+    own copies of the indices they matched, and the texts of those items, which stay put as
+    items are added.  Close the scheduler before using the table otherwise.
+
+    search -  the latest search published, or None.
+    error -  the exception the worker thread stopped with (from loading items), if any.
+    '''
+    __slots__ = (
+        'table', 'indexed', 'search', 'error', 'fd', '_wake_fd', '_woken', '_woken_at',
+        '_pending', '_generation', '_closed', '_condition', '_thread'
+    )
+
+    def __init__(self, table, indexed, previous=None):
+        '''Start the worker thread, narrowing from the previous search, if given.'''
+        self.table = table
+        self.indexed = indexed
+        self.search = None
+        self.error = None
+        self.fd, self._wake_fd = _os.pipe()
+        # whether the wake fd has been written to since the last drain, and when
+        self._woken = False
+        self._woken_at = 0
+        # the newest response, if its search hasn't started, and how many have been submitted
+        self._pending = None
+        self._generation = 0
+        self._closed = False
+        self._condition = _threading.Condition()
+        self._thread = _threading.Thread(target=self._run, args=(previous,))
+        # don't keep the process alive just to finish a search
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, text):
+        '''Search for the text, instead of whatever is being searched for.'''
+        with self._condition:
+            self._pending = text
+            self._generation += 1
+            self._condition.notify_all()
+
+    def wait(self, text, timeout=None):
+        '''
+        Wait, up to the timeout (in seconds), for the search for the text to publish its first
+        matches.  Return the latest search published (raising the worker thread's error, if
+        it has one).
+        '''
+        deadline = None if timeout is None else _clock() + timeout
+        with self._condition:
+            while self.error is None and (self.search is None or self.search.text != text):
+                remaining = None if deadline is None else deadline - _clock()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            if self.error is not None:
+                raise self.error
+            return self.search
+
+    def drain(self):
+        '''
+        Empty the wake fd, and return the latest search published (raising the worker
+        thread's error, if it has one).
+        '''
+        with self._condition:
+            self._woken = False
+        _os.read(self.fd, 512)
+        if self.error is not None:
+            raise self.error
+        return self.search
+
+    def close(self):
+        '''Stop the worker thread (between chunks), and wait for it.'''
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+        _os.close(self.fd)
+        _os.close(self._wake_fd)
+
+    def _publish(self, search):
+        '''Publish the search, and wake the menu - at most once a frame, until it's done.'''
+        with self._condition:
+            self.search = search
+            self._condition.notify_all()
+            now = _clock()
+            if not self._woken and (search.done or now - self._woken_at >= _FRAME):
+                self._woken = True
+                self._woken_at = now
+                _os.write(self._wake_fd, b'.')
+
+    def _next(self):
+        '''
+        Wait for a response to search for, or for more items, while they're loading.
+        Return (text, generation), with None for the text if there's no new response, or
+        None if the scheduler is closed.
+        '''
+        with self._condition:
+            if self._pending is None and not self._closed:
+                self._condition.wait(_STREAM_WAIT if self.table.loading() else None)
+            if self._closed:
+                return None
+            text, self._pending = self._pending, None
+            return text, self._generation
+
+    def _run(self, previous):
+        '''Run the newest search, a chunk at a time (runs on the worker thread).'''
+        table = self.table
+        try:
+            while True:
+                request = self._next()
+                if request is None:
+                    return
+                text, generation = request
+                version = table.version
+                table.refresh()
+                if text is None:
+                    # no new response - search again only if there are new items
+                    if table.version == version or self.search is None:
+                        continue
+                    text = self.search.text
+                search = _Search(table, text, self.indexed, previous)
+                while generation == self._generation and not self._closed:
+                    if not search.done:
+                        search.step()
+                    self._publish(search)
+                    if search.done:
+                        previous = search
+                        break
+                    # let the menu's thread in, between chunks
+                    _time.sleep(0)
+        except Exception as e:
+            with self._condition:
+                self.error = e
+                self._condition.notify_all()
+            _os.write(self._wake_fd, b'!')
+
+
+class _Screen(object):
+    '''
+    The lines of the live menu on the terminal.  The first line is the prompt, where the
+    cursor is kept.  Each draw rewrites only the lines which changed since the last one, in
+    one write.
+    '''
+    __slots__ = ('output', 'lines', 'line')
+
+    def __init__(self, output, num_lines):
+        '''Make room on the terminal for the lines, below the cursor.'''
+        self.output = output
+        self.lines = [''] * num_lines
+        # the line the cursor is on
+        self.line = 0
+        # scroll the terminal, if need be, so that all of the lines fit below the prompt
+        if num_lines > 1:
+            output.write('\r\n' * (num_lines - 1) + '\x1b[{}A'.format(num_lines - 1))
+
+    def _move_to(self, line):
+        '''Move the cursor to the start of the line.'''
+        if line > self.line:
+            self.output.write('\x1b[{}B'.format(line - self.line))
+        elif line < self.line:
+            self.output.write('\x1b[{}A'.format(self.line - line))
+        self.output.write('\r')
+        self.line = line
+
+    def draw(self, lines, column):
+        '''Draw the lines, and put the cursor back on the prompt line, at the column.'''
+        lines = list(lines) + [''] * (len(self.lines) - len(lines))
+        if lines == self.lines:
+            return
+        for number, (old, new) in enumerate(zip(self.lines, lines)):
+            if old != new:
+                self._move_to(number)
+                self.output.write(new + '\x1b[K')
+        self.lines = lines
+        self._move_to(0)
+        if column:
+            self.output.write('\x1b[{}C'.format(column))
+        self.output.flush()
+
+    def close(self, prompt_line):
+        '''Clear the lines, and leave the prompt line, ending it.'''
+        self._move_to(0)
+        self.output.write(prompt_line + '\x1b[K\r\n\x1b[J')
+        self.output.flush()
+
+
+def _terminal_size(stream):
+    '''Return the (columns, lines) of the terminal the stream is on.'''
+    try:
+        return tuple(_os.get_terminal_size(stream.fileno()))
+    except (AttributeError, ValueError, OSError):
+        return 80, 24
+
+
+def _read_keys(fd, decoder):
+    '''
+    Read the keys typed (or pasted) since the last read, and return their actions or text.
+    Escape sequences for keys a live menu doesn't act on are dropped whole.
+    '''
+    text = decoder.decode(_os.read(fd, 1024))
+    keys = []
+    position = 0
+    while position < len(text):
+        if text[position] == '\x1b':
+            end = position + 1
+            if text[end:end + 1] == '[':
+                # a control sequence runs to its final character (after any parameters)
+                end += 1
+                while end < len(text) and not '\x40' <= text[end] <= '\x7e':
+                    end += 1
+                end += 1
+            elif text[end:end + 1] == 'O':
+                end += 2
+            # (a lone escape is ignored)
+            keys.append(_KEYS.get(text[position:end]))
+            position = end
+            continue
+        character = text[position]
+        keys.append(_KEYS.get(character, character if character >= ' ' else None))
+        position += 1
+    return [k for k in keys if k is not None]
+
+
+def _ready(fds):
+    '''Wait for input to read on any of the fds, and return the ones with input.'''
+    import select as _select
+    return _select.select(fds, [], [], None)[0]
+
+
+def _render(menu, search, text, highlight, num_rows, width):
+    '''
+    Return the lines of the live menu: the prompt, the matches, and how many there are.
+    The search may still be for an earlier text, until the one for this text has matches.
+    '''
+    table = menu.table
+    post_prompt = _format_post_prompt(menu._actual_post_prompt(), menu.default)
+    lines = [(post_prompt + text)[-(width - 1):]]
+    for row, index in enumerate(search.first(num_rows)):
+        item = table.texts[index]
+        if menu.indexed:
+            item = '[{}] {}'.format(index, item)
+        if row == highlight:
+            lines.append(_HIGHLIGHT + ('> ' + item)[:width - 1] + _NORMAL)
+        else:
+            lines.append(('  ' + item)[:width - 1])
+    if search.text != text:
+        status = '[!] searching {} options...'.format(len(table))
+    elif search.done:
+        status = '[!] {} of {} options match.'.format(search.count(), len(table))
+    else:
+        status = '[!] {} of {} options match so far...'.format(search.count(), len(table))
+    lines.append(status[:width - 1])
+    return lines
+
+
+def _ask_live(menu, fd):
+    '''
+    Ask the menu live, reading keys from the terminal on the fd, and return the selection.
+
+    Enter selects what the response would select in a menu which isn't live, or else the
+    highlighted match (the first, unless moved with the arrow keys).  Ctrl-U clears the
+    response.  Ctrl-C raises KeyboardInterrupt, and ctrl-D, with no response, EOFError, as
+    input does.
+    '''
+    import codecs as _codecs
+    import termios as _termios
+    import tty as _tty
+    table = menu.table
+    output = menu._output
+    stream = menu.stream
+    encoding = getattr(_sys.stdin, 'encoding', None) or 'utf-8'
+    decoder = _codecs.getincrementaldecoder(encoding)('replace')
+    width, height = _terminal_size(stream)
+    # the matches shown fit on the terminal, under the pre prompt, prompt and match count
+    num_rows = max(1, height - 3)
+    if menu.page_size is not None:
+        num_rows = min(num_rows, menu.page_size)
+    pre_prompt = menu.pre_prompt
+    if menu.default is not None and '{}' in pre_prompt:
+        pre_prompt = pre_prompt.format(menu.default)
+    old_attributes = _termios.tcgetattr(fd)
+    text = ''
+    highlight = 0
+    scheduler = _MatchScheduler(table, menu.indexed)
+    scheduler.submit(text)
+    output.write(pre_prompt + '\r\n')
+    _tty.setraw(fd)
+    screen = _Screen(output, num_rows + 2)
+    lines = ['']
+    menu._start_ask()
+    selection = None
+    try:
+        search = scheduler.wait(text)
+        lines = _render(menu, search, text, highlight, num_rows, width)
+        screen.draw(lines, len(lines[0]))
+        while selection is None:
+            # wait for keys, or for more matches
+            ready = _ready([fd, scheduler.fd])
+            if scheduler.fd in ready:
+                search = scheduler.drain()
+                if fd not in ready:
+                    lines = _render(menu, search, text, highlight, num_rows, width)
+                    screen.draw(lines, len(lines[0]))
+                    continue
+            # from the keys to the redraw
+            with menu._timer('keystroke') as timer:
+                new_text = text
+                for key in _read_keys(fd, decoder):
+                    if key == 'interrupt':
+                        raise KeyboardInterrupt
+                    if key == 'eof' and not new_text:
+                        raise EOFError
+                    if key == 'enter':
+                        # the table is the menu's again, to match the response
+                        scheduler.close()
+                        selection = _select(menu, search, new_text, highlight)
+                        if selection is not None:
+                            break
+                        output.write('\a')
+                        scheduler = _MatchScheduler(table, menu.indexed, search)
+                        scheduler.submit(text)
+                    elif key == 'backspace':
+                        new_text = new_text[:-1]
+                    elif key == 'clear':
+                        new_text = ''
+                    elif key == 'up':
+                        highlight = max(0, highlight - 1)
+                    elif key == 'down':
+                        highlight = min(highlight + 1, max(0, min(search.count(), num_rows) - 1))
+                    elif len(key) == 1:
+                        new_text += key
+                if selection is None:
+                    if new_text != text:
+                        text = new_text
+                        highlight = 0
+                        scheduler.submit(text)
+                        # the first chunk of the search is usually enough to show
+                        search = scheduler.wait(text, _FRAME)
+                    lines = _render(menu, search, text, highlight, num_rows, width)
+                    screen.draw(lines, len(lines[0]))
+                timer.fields['matches'] = search.count()
+    finally:
+        scheduler.close()
+        screen.close(lines[0])
+        _termios.tcsetattr(fd, _termios.TCSADRAIN, old_attributes)
+    menu._finish_ask()
+    return selection
+
+
+def _select(menu, search, text, highlight):
+    '''
+    Return what Enter selects, for the response text: what the response would select in a
+    menu which isn't live, or else the highlighted match, or None, if nothing matches.
+    The search is for the text drawn, which may not be the whole response yet.
+    '''
+    table = menu.table
+    selected_index, match_indices = _match_response(text, table, menu.default, menu.indexed)
+    stats = menu._ask_stats
+    stats['responses'] += 1
+    if selected_index is None:
+        if search.text != text:
+            # the keys typed with the Enter weren't drawn - the first match is highlighted
+            search = _Search(table, text, menu.indexed)
+            highlight = 0
+        while not search.done and search.count() <= highlight:
+            search.step()
+        shown = search.first(highlight + 1)
+        if highlight < len(shown):
+            selected_index = shown[highlight]
+    if selected_index is None:
+        stats['retries'] += 1
+        stats['matches'] += len(match_indices)
+        return None
+    stats['matches'] += 1
+    return table.texts[selected_index]
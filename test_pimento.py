@@ -6,7 +6,12 @@ Test suite for pimento
 # [ Imports ]
 # [ - Python ]
 import inspect
+import io
+import json
+import os
+import subprocess
 import sys
+import time
 # [ - Third Party ]
 import pexpect
 import pytest
@@ -131,6 +136,18 @@ def test_menu_rejects_multiple_matches():
     p.expect('black')
 
 
+def test_menu_no_reprint():
+    # only the error and the prompt after an invalid response
+    p = pexpect.spawn('pimento yes no -p "yes or no?" -P "Please choose: " --no-reprint', timeout=1)
+    expect_menu_prompt(p)
+    p.sendline('maybe')
+    p.expect_exact('[!] "maybe" does not match any of the valid choices.')
+    p.expect_exact('Please choose: ')
+    assert b'yes or no?' not in p.before
+    p.sendline('y')
+    p.expect_exact('yes')
+
+
 def test_menu_default():
     # select the default
     p = pexpect.spawn('pimento yes no -p "Yes/No?" -P "Please select one [{}]: " --default-index=1', timeout=1)
@@ -202,14 +219,44 @@ def test_bad_items_type():
     # with a non-iterable
     with pytest.raises(TypeError):
         pimento.menu(6, "Yes/No?", "Please select one: ")
-    # with an unbounded iterable
-    def generator():
-        x = 0
-        while True:
-            yield x
-            x += 1
-    with pytest.raises(TypeError):
-        pimento.menu(generator(), "Yes/No?", "Please select one: ")
+    # with an empty stream
+    with pytest.raises(ValueError):
+        pimento.menu(iter([]), "Yes/No?", "Please select one: ")
+    # with a stream too short for the default
+    with pytest.raises(ValueError):
+        pimento.menu(iter(['yes', 'no']), "Yes/No?", "Please select one: ", default_index=2)
+
+
+def test_streamed_items():
+    # with a generator which is slow to finish
+    p = pexpect.spawn('python test_pimento.py --generator', timeout=1)
+    p.expect_exact('Select one of the following:')
+    p.expect_exact('  100')
+    p.expect_exact('[!] still loading - 1 options so far.  Enter nothing to refresh.')
+    p.expect_exact('Please select: ')
+    # the items loaded so far can be matched
+    p.sendline('1')
+    p.expect_exact('Result is 100')
+    # the rest are shown once loaded
+    p = pexpect.spawn('python test_pimento.py --generator', timeout=3)
+    p.expect_exact('Please select: ')
+    time.sleep(1)
+    p.sendline('')
+    p.expect_exact('  100')
+    p.expect_exact('  200')
+    p.expect_exact('Please select: ')
+    p.sendline('2')
+    p.expect_exact('Result is 200')
+
+
+def test_piping_slowly_to_cli():
+    # the menu is shown before a slow pipe finishes
+    p = pexpect.spawn('bash', args=['-c', '(echo hello; sleep 2; echo goodbye) | pimento'], timeout=1)
+    p.expect_exact('  hello')
+    p.expect_exact('[!] still loading - 1 options so far.  Enter nothing to refresh.')
+    p.expect_exact('Enter an option to continue: ')
+    p.sendline('h')
+    p.expect_exact('hello')
 
 
 def test_iterable_items():
@@ -304,6 +351,28 @@ def test_menu_documentation():
         insensitive -  allow insensitive matching.  Also drops items which case-insensitively match
           prior items.
         fuzzy -  search for the individual words in the user input anywhere in the item strings.
+        page_size -  show at most this many items at a time.  Entering '>' or '<' shows the next
+            or previous page.
+        reprint -  show the menu again after an invalid response.  If False, only the error
+            and the post prompt are shown again.
+        processes -  check fuzzy matches on a pool of this many processes, when there are
+            enough items to make it worthwhile.
+        max_matches_shown -  when a response matches more items than this, show only the best
+            matches (whole, then prefix, then word-start, then other matches, shortest first),
+            and how many more there are.
+        on_event -  called with a dict for each instrumented event, which can be dumped as
+            JSON.  Its 'event' is one of the timed phases ('validate', 'cache_load',
+            'convert', 'dedup', 'index', 'cache_store', 'render', 'check_response',
+            'completion', 'keystroke'), with the 'seconds' it took, or 'ask', with the totals for the
+            prompt (see the README).
+        compact -  store the items compactly, for huge menus: less memory, slower matching.
+        cache_dir -  a directory to cache the prepared (deduplicated and indexed) items in, so
+            that later menus of the same items, with the same settings, start faster.  The
+            least recently used items are removed once the cache is full.  Streamed items
+            aren't cached.
+        live -  filter the items as the response is typed, showing the matches that fit on the
+            terminal, and select the highlighted one (or what the response selects) on Enter.
+            Needs an interactive terminal (and termios) - otherwise the usual prompt is used.
 
     Specifying a default index:
         The default index must index into the items.  In other words, `items[default_index]`
@@ -322,6 +391,16 @@ def test_menu_documentation():
     '''
 
 
+def test_lazy_imports():
+    # importing pimento doesn't import what it only needs later (pimento runs in shell loops)
+    lazy = ['pkg_resources', 'importlib.metadata', 'argparse', 'readline', 'termios', 'hashlib']
+    imported = subprocess.check_output([
+        sys.executable, '-c',
+        'import sys, pimento; print(" ".join(m for m in {!r} if m in sys.modules))'.format(lazy)
+    ])
+    assert imported.split() == []
+
+
 def test_package_documentation():
     # test the package doc string
     assert pimento.__doc__ == '\nMake simple python cli menus!\n'
@@ -330,14 +409,21 @@ def test_package_documentation():
 def test_module_contents():
     # check that only the expected public functions are public in the module
     public_attributes = [a for a in pimento.__dict__ if not a.startswith('_')]
-    assert public_attributes == ['menu']
+    expected = ['menu', 'resolve', 'Menu']
+    # the asyncio menu needs python 3.5+
+    if sys.version_info >= (3, 5):
+        expected.append('amenu')
+    assert public_attributes == expected
 
 
 def test_cli_script_help():
     # check the CLI script help message
     expected_help_text = '''usage: pimento [-h] [--version] [--pre TEXT] [--post TEXT]
                [--default-index INT] [--indexed] [--insensitive] [--fuzzy]
-               [--stdout]
+               [--page-size INT] [--no-reprint] [--max-shown INT] [--live]
+               [--compact] [--processes INT] [--cache-dir DIR] [--stats FILE]
+               [--batch FILE] [--from-file PATH] [--null] [--stdout]
+               [--daemon] [--socket PATH] [--idle-timeout SECONDS]
                [option [option ...]]
 
 
@@ -361,8 +447,44 @@ optional arguments:
                         that case-insensitively match prior items.
   --fuzzy, -f           search for the individual words in the user input
                         anywhere in the item strings.
+  --page-size INT       Show at most INT options at a time. Enter '>' or '<'
+                        to change pages.
+  --no-reprint          Do not show the menu again after an invalid response -
+                        just the error and the post prompt.
+  --max-shown INT       Show at most INT of the matches to an ambiguous
+                        response - the best ones.
+  --live                Filter the options as the response is typed, and
+                        select the highlighted one on Enter.
+  --compact             Store the options compactly: less memory for huge
+                        menus, but slower matching.
+  --processes INT       Check fuzzy matches on a pool of INT processes, when
+                        there are enough items.
+  --cache-dir DIR       Cache the prepared options in DIR, so that later menus
+                        of the same options start faster. Piped options are
+                        read in whole first. [$PIMENTO_CACHE_DIR]
+  --stats FILE          Write timings and counts for the menu to FILE, as a
+                        line of JSON per event.
+  --batch FILE          Don't prompt: resolve each line of FILE ('-' for
+                        stdin) as a response, and print a tab-separated result
+                        for each: "selected", the response and the selection;
+                        "ambiguous", the response and its matches; or "no-
+                        match" and the response.
+  --from-file PATH      Read more options from the lines of PATH. The file is
+                        memory-mapped, and only the options shown or matched
+                        are read into memory.
+  --null, -0            Options from stdin or --from-file are separated by
+                        NULs (as from find -print0), not newlines.
   --stdout              Use stdout for interactive output (instead of the
                         default: stderr).
+  --daemon              Don't show a menu: serve menus for other pimento
+                        commands from the socket, keeping their prepared
+                        options in memory. Commands use the daemon when
+                        $PIMENTO_SOCKET is set to its socket.
+  --socket PATH         The Unix socket for --daemon to listen on.
+                        [$PIMENTO_SOCKET]
+  --idle-timeout SECONDS
+                        Stop the daemon after SECONDS without a menu to serve.
+                        [600]
 
 The default for the post prompt is "Enter an option to continue: ". If
 --default-index is specified, the default option value will be printed in the
@@ -376,6 +498,491 @@ post prompt as well.'''
             assert line in p.before
 
 
+def test_paging():
+    # show a page at a time
+    p = pexpect.spawn('pimento red blue green black grey --page-size 2 -i', timeout=1)
+    p.expect_exact('Options:')
+    p.expect_exact('  [0] red')
+    p.expect_exact('  [1] blue')
+    p.expect_exact("[!] showing options 1-2 of 5.  Enter '>' or '<' for the next or previous page.")
+    assert b'green' not in p.before
+    p.expect_exact('Enter an option to continue: ')
+    # next page, keeping the indices
+    p.sendline('>')
+    p.expect_exact('  [2] green')
+    p.expect_exact('  [3] black')
+    p.expect_exact("[!] showing options 3-4 of 5.")
+    # past the last page stays on the last page
+    p.sendline('>')
+    p.expect_exact('  [4] grey')
+    p.expect_exact("[!] showing options 5-5 of 5.")
+    p.sendline('>')
+    p.expect_exact("[!] showing options 5-5 of 5.")
+    p.sendline('<')
+    p.expect_exact("[!] showing options 3-4 of 5.")
+    # items on other pages can still be chosen
+    p.sendline('r')
+    p.expect_exact('red')
+    # bad page sizes
+    with pytest.raises(TypeError):
+        pimento.menu(['yes', 'no'], page_size='2')
+    with pytest.raises(ValueError):
+        pimento.menu(['yes', 'no'], page_size=0)
+
+
+def test_resolve():
+    # resolve responses as a menu would
+    items = ['yes', 'no', 'blue', 'black', 'Blue', 'no ', '']
+    responses = ['y', 'bl', 'x', '', '2', 'BLACK']
+    assert list(pimento.resolve(responses, items)) == [
+        ('y', 'yes', []),
+        ('bl', None, ['blue', 'black']),
+        ('x', None, []),
+        ('', None, []),
+        ('2', None, []),
+        ('BLACK', None, []),
+    ]
+    resolutions = pimento.resolve(iter(responses), items, insensitive=True, indexed=True)
+    assert list(resolutions) == [
+        ('y', 'yes', []),
+        ('bl', None, ['blue', 'black']),
+        ('x', None, []),
+        ('', None, []),
+        ('2', 'blue', []),
+        ('BLACK', 'black', []),
+    ]
+    # fuzzy
+    resolutions = pimento.resolve(['thing', 'e e'], ['a blue thing', 'one green thing'], fuzzy=True)
+    assert list(resolutions) == [
+        ('thing', None, ['a blue thing', 'one green thing']),
+        ('e e', 'one green thing', []),
+    ]
+    # bad items
+    with pytest.raises(ValueError):
+        pimento.resolve(['y'], ['', ' '])
+
+
+def test_menu_class(monkeypatch):
+    # ask a menu more than once, changing its items in between
+    monkeypatch.setattr(sys, 'stdin', io.StringIO(u'blu\nbla\nz\n\nbla\n'))
+    m = pimento.Menu(['yes', 'no', 'blue', 'black', 'no'], default_index=0)
+    assert m.ask() == 'blue'
+    assert m.ask() == 'black'
+    m.add(['zebra', 'yes', ''])
+    assert m.ask() == 'zebra'
+    assert m.ask() == 'yes'
+    m.remove(['yes', 'blue', 'maybe'])
+    assert m.table.texts == ['no', 'black', 'zebra']
+    assert m.default is None
+    assert m.ask() == 'black'
+    m.remove(['no', 'black', 'zebra'])
+    with pytest.raises(ValueError):
+        m.ask()
+
+
+def test_max_matches_shown():
+    # only the best matches to an ambiguous response are shown, best first, with a count of the rest
+    items = ['a blue thing', 'blue', 'the blues', 'bluebird', 'true blue', 'sky blue sea', 'nonblue']
+    table = pimento._ItemTable(items, False, True)
+    stream = io.StringIO()
+    assert pimento._check_response('blu', table, None, False, stream, 3) is None
+    assert stream.getvalue() == (
+        '[!] "blu" matches multiple choices:\n'
+        '[!]   blue\n'
+        '[!]   bluebird\n'
+        '[!]   the blues\n'
+        '[!]   ...and 4 more.\n'
+        '[!] Please specify your choice further.\n'
+    )
+    # all of the matches fit - shown in item order
+    stream = io.StringIO()
+    pimento._check_response('blu', table, None, False, stream, 7)
+    assert '...and' not in stream.getvalue()
+    assert stream.getvalue().splitlines()[1:-1] == ['[!]   ' + i for i in items]
+    with pytest.raises(ValueError):
+        pimento.Menu(items, max_matches_shown=0)
+
+
+def test_output_buffer(monkeypatch):
+    # each prompt cycle's output goes out in one write
+    monkeypatch.setattr(sys, 'stdin', io.StringIO(u'bl\nx\nblu\n'))
+    m = pimento.Menu(['yes', 'blue', 'black'], stream=sys.stderr)
+    sizes = []
+    m._output.hook = sizes.append
+    assert m.ask() == 'blue'
+    assert m._output.writes == len(sizes) == 3
+    assert m._output.bytes_written == sum(sizes)
+    # text-only streams are written as text
+    output = pimento._OutputBuffer(io.StringIO())
+    output.write('a\n')
+    output.write_menu(('b\n', None))
+    output.flush()
+    output.flush()
+    assert output.stream.getvalue() == 'a\nb\n'
+    assert (output.writes, output.bytes_written) == (1, 4)
+
+
+def test_on_event(monkeypatch):
+    # the menu reports its phases and totals
+    monkeypatch.setattr(sys, 'stdin', io.StringIO(u'bl\nx\nblu\n'))
+    events = []
+    assert pimento.menu(['yes', 'blue', 'black', 'yes'], on_event=events.append) == 'blue'
+    assert [e['event'] for e in events] == [
+        'validate', 'convert', 'dedup', 'index', 'render',
+        'check_response', 'check_response', 'check_response', 'ask'
+    ]
+    assert all(e['seconds'] >= 0 for e in events)
+    assert [e['matches'] for e in events if e['event'] == 'check_response'] == [2, 0, 1]
+    ask = events[-1]
+    assert (ask['items'], ask['responses'], ask['retries'], ask['matches']) == (3, 3, 2, 3)
+    assert ask['writes'] == 3 and ask['bytes_written'] > 0
+
+
+def test_stats_cli(tmpdir):
+    # the CLI writes the events as JSON lines
+    stats = tmpdir.join('stats.jsonl')
+    p = pexpect.spawn('pimento yes no --stats {}'.format(stats), timeout=1)
+    p.expect_exact('Enter an option to continue: ')
+    p.sendline('y')
+    p.expect_exact('yes')
+    p.expect(pexpect.EOF)
+    events = [json.loads(l) for l in stats.readlines()]
+    assert [e['event'] for e in events][-2:] == ['check_response', 'ask']
+    # a stats file which can't be opened is an error
+    p = pexpect.spawn('pimento yes no --stats {}'.format(tmpdir.join('missing', 'stats.jsonl')), timeout=1)
+    p.expect_exact('ERROR: [Errno 2] No such file or directory')
+    p.expect(pexpect.EOF)
+    p.close()
+    assert p.exitstatus == 1
+
+
+class StubReadline(object):
+    # stands in for the readline module, so the completion closures can be called directly
+    __doc__ = 'readline'
+
+    def __init__(self):
+        self.line = ''
+        self.completer = None
+
+    def get_line_buffer(self):
+        return self.line
+
+    def set_completer_delims(self, delims):
+        pass
+
+    def parse_and_bind(self, binding):
+        pass
+
+    def set_completer(self, completer):
+        self.completer = completer
+
+    def set_completion_display_matches_hook(self, hook):
+        pass
+
+    def complete(self, line, text):
+        # all of the completions for the text at the end of the line, as readline asks for them
+        self.line = line
+        completions = []
+        while True:
+            try:
+                completions.append(self.completer(text, len(completions)))
+            except IndexError:
+                return completions
+
+
+def test_tab_completion_cache(monkeypatch):
+    # completions are matched once per tab, narrowed as the line grows, and matched again
+    # once the items change
+    readline = StubReadline()
+    monkeypatch.setattr(pimento, '_readline', readline)
+    searches = []
+    fuzzy_indices = pimento._ItemTable.fuzzy_indices
+
+    def counted_fuzzy_indices(table, response, candidates=None):
+        searches.append((response, None if candidates is None else list(candidates)))
+        return fuzzy_indices(table, response, candidates)
+    monkeypatch.setattr(pimento._ItemTable, 'fuzzy_indices', counted_fuzzy_indices)
+    table = pimento._ItemTable(['blue', 'black', 'brown', 'red'], False, True)
+    pimento._tab_complete_init(table, 'Enter an option: ', pimento._OutputBuffer(sys.stderr))
+    assert readline.complete('b', 'b') == ['blue', 'black', 'brown']
+    assert searches == [('b', None)]
+    assert readline.complete('bl', 'bl') == ['blue', 'black']
+    assert searches[1:] == [('bl', [0, 1, 2])]
+    assert readline.complete('bl', 'bl') == ['blue', 'black']
+    assert len(searches) == 2
+    table.add(['blond'])
+    assert readline.complete('bl', 'bl') == ['blue', 'black', 'blond']
+    assert searches[2:] == [('bl', None)]
+
+
+def test_table_cache(tmpdir, monkeypatch):
+    # a second menu of the same items loads the prepared table instead of preparing it again
+    cache_dir = str(tmpdir.join('cache'))
+    items = ['yes', 'blue', 'black', 'yes', 'BLUE']
+    for hit in (False, True):
+        monkeypatch.setattr(sys, 'stdin', io.StringIO(u'bl\nblu\n'))
+        events = []
+        assert pimento.menu(
+            items, insensitive=True, fuzzy=True, on_event=events.append, cache_dir=cache_dir
+        ) == 'blue'
+        phases = [e['event'] for e in events]
+        assert events[1] == {'event': 'cache_load', 'hit': hit, 'seconds': events[1]['seconds']}
+        assert ('index' in phases) == ('cache_store' in phases) == (not hit)
+    assert len(os.listdir(cache_dir)) == 1
+    # other items, or settings, are cached separately
+    assert [r[1] for r in pimento.resolve(['b'], items, cache_dir=cache_dir)] == [None]
+    assert [r[1] for r in pimento.resolve(['b'], [1, 2], cache_dir=cache_dir)] == [None]
+    assert len(os.listdir(cache_dir)) == 3
+    # mapped lines are cached as compact strings
+    path = tmpdir.join('items')
+    path.write('b\na\n\nb\n')
+    for _ in range(2):
+        table = pimento.Menu(pimento._MappedLines(str(path)), cache_dir=cache_dir).table
+        assert list(table.texts) == ['b', 'a'] and table.find('a') == 1
+    assert type(table.texts) is pimento._CompactStrings
+    # unreadable tables are rebuilt, and the least recently used are removed
+    cache = pimento._TableCache(cache_dir, max_bytes=0)
+    key = pimento._table_key(['x'], False, False, False)
+    with open(os.path.join(cache_dir, key + '.table'), 'wb') as table_file:
+        table_file.write(b'garbage')
+    assert cache.load(key) is None
+    cache.store(key, pimento._ItemTable(['x'], False, False))
+    assert os.listdir(cache_dir) == []
+
+
+def test_daemon(tmpdir):
+    # commands hand their menus over to the daemon, which keeps their items
+    socket_path = str(tmpdir.join('socket'))
+    stats = tmpdir.join('stats.jsonl')
+    # a path which isn't a socket is left alone
+    notes = tmpdir.join('notes.txt')
+    notes.write('keep')
+    assert subprocess.call(['pimento', '--daemon', '--socket', str(notes)]) == 1
+    assert notes.read() == 'keep'
+    daemon = subprocess.Popen(['pimento', '--daemon', '--socket', socket_path, '--idle-timeout', '2'])
+    try:
+        for _ in range(50):
+            if os.path.exists(socket_path):
+                break
+            time.sleep(0.1)
+        env = dict(os.environ, PIMENTO_SOCKET=socket_path)
+        for _ in range(2):
+            p = pexpect.spawn(
+                'bash', args=['-c', 'printf "red\\nblue\\n" | pimento --stats {}'.format(stats)],
+                env=env, timeout=3
+            )
+            p.expect_exact('  blue')
+            p.expect_exact('Enter an option to continue: ')
+            p.sendline('b')
+            p.expect_exact('blue')
+            p.expect(pexpect.EOF)
+            p.close()
+            assert p.exitstatus == 0
+            # the daemon keeps the items once the menu is done
+            time.sleep(0.2)
+        loads = [json.loads(l) for l in stats.readlines() if 'cache_load' in l]
+        assert [e['hit'] for e in loads] == [False, True]
+        p = pexpect.spawn('pimento yes -d 4', env=env, timeout=3)
+        p.expect_exact('ERROR: The default index (4) >= length of the list (1)')
+        p.expect(pexpect.EOF)
+        p.close()
+        assert p.exitstatus == 1
+        # the daemon stops once it's idle
+        assert daemon.wait(5) == 0
+        assert not os.path.exists(socket_path)
+    finally:
+        if daemon.poll() is None:
+            daemon.kill()
+
+
+def test_live_cli():
+    # the matches are filtered as the response is typed, and Enter selects the highlighted one
+    p = pexpect.spawn('pimento red blue green black grey white --live -P "color: "', timeout=1, dimensions=(10, 40))
+    p.expect_exact('color: ')
+    p.expect_exact('[!] 6 of 6 options match.')
+    p.send('b')
+    p.expect_exact('  black')
+    p.expect_exact('[!] 2 of 6 options match.')
+    p.send('lu')
+    p.expect_exact('[!] 1 of 6 options match.')
+    p.send('\x7f\x7f')
+    p.expect_exact('[!] 2 of 6 options match.')
+    p.send('\x1b[B')
+    p.expect_exact('> black')
+    p.send('\r')
+    p.expect_exact('black\r\n')
+    p.expect(pexpect.EOF)
+    # a response which selects an item by itself selects it, rather than the highlighted one
+    p = pexpect.spawn('pimento 100 200 300 -i --live', timeout=1, dimensions=(10, 40))
+    p.expect_exact('[!] 3 of 3 options match.')
+    p.send('2\r')
+    p.expect_exact('300\r\n')
+    p.expect(pexpect.EOF)
+
+
+def test_live_unavailable(monkeypatch, capsys):
+    # without a terminal, the live menu falls back to the usual prompt
+    monkeypatch.setattr(sys, 'stdin', io.StringIO(u'b\n'))
+    assert pimento.menu(['a', 'b'], stream=sys.stderr, live=True) == 'b'
+    assert capsys.readouterr().err.startswith(
+        '[!] input or output stream is not interactive - live mode not available\n'
+    )
+
+
+def test_live_keys():
+    # escape sequences are read whole, and the ones without an action are dropped
+    import codecs
+    from pimento import _live
+    read_fd, write_fd = os.pipe()
+    try:
+        os.write(write_fd, b'b\x1b[3~\x1b[1;5Cc\x1b[A\x1bOB\x1b[5~d\x7f\r')
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        assert _live._read_keys(read_fd, decoder) == [
+            'b', 'c', 'up', 'down', 'd', 'backspace', 'enter'
+        ]
+    finally:
+        os.close(read_fd)
+        os.close(write_fd)
+
+
+def test_live_search(monkeypatch):
+    # the live search finds the matches in item order, a chunk at a time when fuzzy
+    from pimento import _live
+    table = pimento._ItemTable(['foo', 'bar', 'food', 'baz', 'fob'], False, False)
+    prefix_search = _live._Search(table, 'fo', False)
+    assert prefix_search.done and prefix_search.count() == 3 and prefix_search.first(2) == [0, 2]
+    search = _live._Search(table, '', False)
+    assert search.count() == 5 and search.first(2) == [0, 1]
+    # indexed responses pin the item they select by index
+    search = _live._Search(table, '4', True)
+    assert search.count() == 0 and search.first(2) == [4]
+    # the search keeps its matches as the table's sorted keys are rebuilt
+    table.add(['a', 'fo'])
+    table.prefix_range('b')
+    assert prefix_search.count() == 3 and prefix_search.first(5) == [0, 2, 4]
+    monkeypatch.setattr(_live, '_SCAN_CHUNK', 2)
+    table = pimento._ItemTable(['a b', 'b c', 'c a', 'ab'], True, True)
+    search = _live._Search(table, 'A', False)
+    search.step()
+    assert not search.done and search.first(5) == [0, 2]
+    while not search.done:
+        search.step()
+    assert search.count() == 3 and search.first(5) == [0, 2, 3]
+    # only the candidates from the word index are checked
+    assert list(_live._Search(table, 'c', False)._todo) == [1, 2]
+    no_match = _live._Search(table, 'z', False)
+    no_match.step()
+    assert no_match.done and no_match.count() == 0
+    # a longer response only checks the matches to the shorter one
+    longer = _live._Search(table, 'A B', False, search)
+    assert list(longer._todo) == [0, 2, 3]
+
+
+def test_live_scheduler(monkeypatch):
+    # the match scheduler searches for the newest response, publishing matches as they are found
+    from pimento import _live
+    monkeypatch.setattr(_live, '_SCAN_CHUNK', 10)
+    table = pimento._ItemTable(['item {}'.format(i) for i in range(5000)], False, True)
+    scheduler = _live._MatchScheduler(table, False)
+    try:
+        for text in ('i', 'it', '49'):
+            scheduler.submit(text)
+        search = scheduler.wait('49')
+        assert search.text == '49'
+        while not search.done:
+            _live._ready([scheduler.fd])
+            search = scheduler.drain()
+        assert search.text == '49'
+        assert search.first(3) == [49, 149, 249]
+        assert search.count() == len([i for i in range(5000) if '49' in str(i)])
+    finally:
+        scheduler.close()
+
+
+def test_live_screen():
+    # the live screen only redraws the lines which changed
+    from pimento import _live
+    output = io.StringIO()
+    screen = _live._Screen(output, 3)
+    assert output.getvalue() == '\r\n\r\n\x1b[2A'
+    screen.draw(['> a', '  b', 'end'], 3)
+    output.seek(0)
+    output.truncate()
+    screen.draw(['> ab', '  b', 'x'], 4)
+    assert output.getvalue() == '\r> ab\x1b[K\x1b[2B\rx\x1b[K\x1b[2A\r\x1b[4C'
+    output.seek(0)
+    output.truncate()
+    screen.draw(['> ab', '  b', 'x'], 4)
+    assert output.getvalue() == ''
+
+
+def test_item_table_remove():
+    # the item table still matches correctly after items are added and removed
+    table = pimento._ItemTable(['foo', 'bar', 'food', 'baz'], False, False)
+    assert table.prefix_indices('foo') == [0, 2]
+    table.remove_indices([0, 3])
+    assert table.texts == ['bar', 'food']
+    assert table.prefix_indices('foo') == [1]
+    assert table.find('foo') is None
+    table.add(['foo', 'bar'])
+    assert table.texts == ['bar', 'food', 'foo']
+    assert table.prefix_indices('foo') == [1, 2]
+    assert table.find('foo') == 2
+    table = pimento._ItemTable(['a b', 'c d', 'b e'], True, True)
+    table.remove_indices([0])
+    assert table.match_indices('B') == [1]
+
+
+def test_from_file_cli(tmpdir):
+    # options from a mapped file, newline- or NUL-separated
+    path = tmpdir.join('items')
+    path.write('yes\nno\nmaybe\n')
+    p = pexpect.spawn('pimento first --from-file {}'.format(path), timeout=1)
+    p.expect_exact('Options:')
+    p.expect_exact('  first')
+    p.expect_exact('  yes')
+    p.expect_exact('  maybe')
+    p.expect_exact('Enter an option to continue: ')
+    p.sendline('m')
+    p.expect_exact('maybe')
+    p.expect(pexpect.EOF)
+    # piped options are ignored, with a warning
+    command = 'printf "year\\n" | pimento first --from-file {} --batch <(echo ye)'.format(path)
+    p = pexpect.spawn('bash', args=['-c', command], timeout=1)
+    p.expect_exact('[!] options piped in are ignored - they come from --from-file')
+    p.expect_exact('selected\tye\tyes')
+    p.expect(pexpect.EOF)
+    path.write_binary(b'yes\x00no\x00')
+    p = pexpect.spawn('pimento -0 --from-file {}'.format(path), timeout=1)
+    p.expect_exact('  no')
+    p.expect_exact('Enter an option to continue: ')
+    p.sendline('n')
+    p.expect_exact('no')
+    p.expect(pexpect.EOF)
+    # NUL-separated stdin
+    p = pexpect.spawn('bash', args=['-c', 'printf "a b\\0c\\0" | pimento -0 --batch <(echo c)'], timeout=1)
+    p.expect_exact('selected\tc\tc')
+    p.expect(pexpect.EOF)
+    p = pexpect.spawn('pimento --from-file {}'.format(tmpdir.join('missing')), timeout=1)
+    p.expect_exact('ERROR: ')
+    p.expect(pexpect.EOF)
+
+
+def test_batch_cli():
+    # resolve responses from stdin
+    p = pexpect.spawn('bash', args=['-c', 'printf "y\\nbl\\nx\\n" | pimento yes blue black --batch -'], timeout=1)
+    p.expect_exact('selected\ty\tyes')
+    p.expect_exact('ambiguous\tbl\tblue\tblack')
+    p.expect_exact('no-match\tx')
+    p.expect(pexpect.EOF)
+    # a missing file of responses is an error
+    p = pexpect.spawn('pimento yes --batch missing-responses.txt', timeout=1)
+    p.expect_exact('ERROR: [Errno 2] No such file or directory')
+    p.expect(pexpect.EOF)
+    p.close()
+    assert p.exitstatus == 1
+
+
 def test_default_pre_prompt():
     # validate the default pre-prompt
     p = pexpect.spawn('python test_pimento.py --list-only', timeout=1)
@@ -919,6 +1526,138 @@ def test_fuzzy_option_tc_matching():
     matches = pimento._get_fuzzy_tc_matches(text, 'bc ab cd ' + text, options)
     assert matches == correct_matches
 
+
+def test_item_table_prefix():
+    # prefix matches come back in item order, and exact matches are found, in either case
+    items = ['foo bar', 'Foo', 'baz', 'foo', 'FOOD']
+    table = pimento._ItemTable(items, False, False)
+    assert table.prefix_indices('foo') == [0, 3]
+    assert table.prefix_indices('F') == [1, 4]
+    assert table.prefix_indices('q') == []
+    assert table.exact_index('foo', [0, 3]) == 3
+    assert table.exact_index('fo', [0, 3]) is None
+    items = ['foo bar', 'Foo', 'baz', 'FOOD']
+    table = pimento._ItemTable(items, True, False)
+    assert table.prefix_indices('FOO') == [0, 1, 3]
+    assert table.prefix_indices('Ba') == [2]
+    assert table.exact_index('fOO', [0, 1, 3]) == 1
+
+
+def test_item_table_fuzzy():
+    # fuzzy matches, and fuzzily exact matches regardless of word order
+    items = ['foo', 'foo bar', 'foo bar baz', 'Bar Foo Quux']
+    table = pimento._ItemTable(items, True, True)
+    assert table.match_indices('oo') == [0, 1, 2, 3]
+    assert table.match_indices('bar foo') == [1, 2, 3]
+    assert table.exact_index('BAR foo', [1, 2, 3]) == 1
+    assert table.exact_index('bar', [1, 2, 3]) is None
+    # an item's own text selects it, even if another item has the same words first
+    assert [r[1] for r in pimento.resolve(['bar foo'], ['foo bar', 'bar foo'], fuzzy=True)] == [
+        'bar foo'
+    ]
+
+
+def test_parallel_fuzzy_matching(monkeypatch):
+    # fuzzy matches checked on a process pool are the same, in the same order, as serial ones
+    monkeypatch.setattr(pimento, '_PARALLEL_THRESHOLD', 1)
+    items = ['item {} {}'.format(i, ['red', 'green', 'blue'][i % 3]) for i in range(100)]
+    serial = pimento._ItemTable(list(items), False, True)
+    parallel = pimento._ItemTable(list(items), False, True, processes=2)
+    try:
+        for response in ['re', 'e 1', 'blue 9', 'item', 'x']:
+            assert parallel.fuzzy_indices(response) == serial.fuzzy_indices(response)
+        # changing the items replaces the pool
+        parallel.add(['item 100 red'])
+        serial.add(['item 100 red'])
+        assert parallel.fuzzy_indices('100') == serial.fuzzy_indices('100') == [100]
+    finally:
+        parallel.close()
+    with pytest.raises(ValueError):
+        pimento.resolve(['y'], ['yes'], processes=0)
+
+
+def test_compact_strings():
+    # compact strings read back as stored, non-ascii text and undecodable bytes included
+    items = ['foo', '', u'caf\xe9', u'bad \udcff byte', 'bar']
+    strings = pimento._CompactStrings(items)
+    assert len(strings) == 5
+    assert strings == items
+    assert strings[2] == u'caf\xe9' and strings[-1] == 'bar'
+    assert strings[1:3] == ['', u'caf\xe9']
+    strings.append('baz')
+    strings.keep([3, 4, 5])
+    assert list(strings) == [u'bad \udcff byte', 'bar', 'baz']
+    with pytest.raises(IndexError):
+        strings[3]
+    # a page is read straight from its slice
+    assert pimento._render_menu('Options:', strings, None, False, page_size=2, page=1) == (
+        'Options:\n  baz\n[!] showing options 3-3 of 3.  Enter \'>\' or \'<\' for the next'
+        ' or previous page.\n'
+    )
+
+
+def test_mapped_lines(tmpdir):
+    # mapped lines are split, rstripped and decoded as piped lines are, and deduplicated in a menu
+    path = tmpdir.join('items')
+    path.write_binary(b'foo  \nbar\r\n\nfoo\ncaf\xc3\xa9\nbad \xff\nlast')
+    lines = pimento._MappedLines(str(path))
+    assert list(lines) == ['foo', 'bar', '', 'foo', u'caf\xe9', u'bad \udcff', 'last']
+    path.write_binary(b'a b\x00c\nd\x00\x00')
+    assert list(pimento._MappedLines(str(path), b'\x00')) == ['a b', 'c\nd', '']
+    path.write_binary(b'')
+    assert list(pimento._MappedLines(str(path))) == []
+    path.write_binary(b'b\na\n\nb\nA\n')
+    table = pimento.Menu(pimento._MappedLines(str(path)), insensitive=True).table
+    assert list(table.texts) == ['b', 'a']
+    assert [r[1] for r in pimento.resolve(['a', 'A'], pimento._MappedLines(str(path)))] == ['a', 'A']
+
+
+def test_compact_item_table():
+    # a compact item table matches just as a normal one, before and after adds and removes
+    items = ['foo bar', 'Foo', 'baz', 'FOOD', 'a bar foo']
+    for insensitive in (False, True):
+        for fuzzy in (False, True):
+            normal = pimento._ItemTable(list(items), insensitive, fuzzy)
+            compact = pimento._ItemTable(list(items), insensitive, fuzzy, compact=True)
+            for table in (normal, compact):
+                table.add(['Baz', 'bar'])
+                table.remove_indices([1])
+            assert compact.texts == normal.texts
+            for response in ['fo', 'FOO', 'bar foo', 'ba', 'b', 'x']:
+                assert compact.match_indices(response) == normal.match_indices(response)
+                assert compact.find(response) == normal.find(response)
+
+
+def test_word_index():
+    # the word index narrows candidates to items with a word containing every fragment
+    items = [('alpha', 'beta'), ('alphabet',), ('gamma', 'beta'), ('beta', 'beta')]
+    index = pimento._WordIndex(items)
+    assert index.postings[index.words.index('beta')] == [0, 2, 3]
+    assert index.candidates(['alph']) == set([0, 1])
+    assert index.candidates(['bet', 'al']) == set([0, 1])
+    assert index.candidates(['ta', 'mm']) == set([2])
+    assert index.candidates(['tab']) == set()
+
+
+def test_fuzzy_matching_assignment():
+    # fuzzy matching finds an assignment of response words to item words when greedy would not
+    assert pimento._fuzzily_matches(['b', 'c', 'a'], ['ca', 'abc', 'bb'])
+    assert pimento._fuzzily_matches(['ab', 'a', 'b'], ['xb', 'ab', 'ax'])
+    assert not pimento._fuzzily_matches(['a', 'a', 'a'], ['ab', 'ba'])
+    assert not pimento._fuzzily_matches(['ab', 'b'], ['ab', 'ac'])
+
+
+def test_match_response_indices():
+    # responses are matched to the indices of the items, the default included
+    table = pimento._ItemTable(['Yes', 'no', 'nope'], True, False)
+    assert pimento._match_response('y', table, None, False) == (0, [])
+    assert pimento._match_response('NO', table, None, False) == (1, [])
+    assert pimento._match_response('n', table, None, False) == (None, [1, 2])
+    assert pimento._match_response('m', table, None, False) == (None, [])
+    assert pimento._match_response('2', table, None, True) == (2, [])
+    assert pimento._match_response('', table, 'nope', False) == (2, [])
+    assert pimento._match_response('', table, None, False) == (None, [])
+
 # [ Manual Interaction ]
 if __name__ == '__main__':
     # create a menu with specific args - this is to functionally test specific API inputs which should
@@ -936,6 +1675,8 @@ if __name__ == '__main__':
                         action='store_true')
     group.add_argument('--set', help='use a set',
                         action='store_true')
+    group.add_argument('--generator', help='use a generator which is slow to finish',
+                        action='store_true')
     group.add_argument('--pre-only', help='only a pre-prompt',
                         action='store_true')
     group.add_argument('--pre-only-default', help='only a pre-prompt with a default arg',
@@ -953,6 +1694,13 @@ if __name__ == '__main__':
         result = pimento.menu({'key1': 'v1', 'key2': 'v2'}, "Select one of the following:", "Please select: ")
     elif args.set:
         result = pimento.menu(set([1, 2]), "Select one of the following:", "Please select: ")
+    elif args.generator:
+        def generator():
+            yield 100
+            import time
+            time.sleep(1)
+            yield 200
+        result = pimento.menu(generator(), "Select one of the following:", "Please select: ")
     elif args.pre_only:
         result = pimento.menu([1, 2], "Select one of the following:", )
     elif args.pre_only_default:
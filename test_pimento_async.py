@@ -0,0 +1,83 @@
+'''
+Test suite for pimento's asyncio menu
+
+This is a module of its own because its syntax is python 3.5+ only (see conftest.py).
+'''
+
+
+# [ Imports ]
+# [ - Python ]
+import asyncio
+import io
+import os
+import sys
+# [ - Third Party ]
+import pytest
+# [ - Project ]
+import pimento
+
+
+# [ Helpers ]
+def run(coroutine):
+    # run the coroutine to completion on a new event loop (asyncio.run is 3.7+)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+class AsyncItems(object):
+    # the items, as an async iterable (async generators are 3.6+)
+    def __init__(self, items):
+        self.items = iter(items)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self.items)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+# [ Tests ]
+def test_amenu(monkeypatch):
+    # prompt asynchronously, with responses from a pipe
+    read_fd, write_fd = os.pipe()
+    monkeypatch.setattr(sys, 'stdin', os.fdopen(read_fd))
+
+    async def ask():
+        ticks = []
+
+        async def tick():
+            while True:
+                ticks.append(None)
+                await asyncio.sleep(0.01)
+        ticker = asyncio.ensure_future(tick())
+        items = AsyncItems(['yes', 'no', 'blue', 'black'])
+        selection = asyncio.ensure_future(pimento.amenu(items, fuzzy=True))
+        # the menu is waiting for a response, without blocking the ticker
+        await asyncio.sleep(0.1)
+        assert ticks and not selection.done()
+        os.write(write_fd, b'bl\nb')
+        await asyncio.sleep(0.1)
+        assert not selection.done()
+        os.write(write_fd, b'lu\n')
+        result = await selection
+        ticker.cancel()
+        return result
+    assert run(ask()) == 'blue'
+    # timeouts
+    with pytest.raises(asyncio.TimeoutError):
+        run(pimento.amenu(['yes', 'no'], timeout=0.1))
+    # end of input
+    os.close(write_fd)
+    with pytest.raises(EOFError):
+        run(pimento.amenu(['yes', 'no']))
+    # stdin with no file descriptor
+    monkeypatch.setattr(sys, 'stdin', io.StringIO(u'x\nn\n'))
+    assert run(pimento.amenu(['yes', 'no'])) == 'no'